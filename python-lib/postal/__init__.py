@@ -2,61 +2,614 @@
 '''
 An object to remotely access data from Postal.
 '''
-import gc
+import collections
+import concurrent.futures
 import getpass
+import hashlib
 import json
 import lzma
+import math
+import numpy
 import os
 import pandas
-import psutil
 import re
-import struct
 import sys
+import tempfile
+import time
 import urllib.parse
 import urllib3
-http = urllib3.PoolManager()
+import zstandard
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 POSTAL_HOST = os.environ.get('POSTAL_HOST', 'http://postal.domain.com')
 ENABLE_COMPRESSION = True
 
+DECOMPRESSORS = {
+    'zstd': lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+    'lzma': lambda: lzma.LZMADecompressor(format=lzma.FORMAT_ALONE).decompress,
+    'none': lambda: bytes,
+}
+'''The codecs that can be decoded, and how to create a decompressor for each of them.'''
+if lz4 is not None:
+    DECOMPRESSORS['lz4'] = lambda: lz4.frame.LZ4FrameDecompressor().decompress
+
+CODECS = [codec for codec in ['zstd', 'lz4', 'lzma', 'none'] if codec in DECOMPRESSORS]
+'''The codecs requested from the server, in order of preference.'''
+
+FETCH_WORKERS = 8
+'''The default number of columns fetched concurrently.'''
+
+MAX_WORKERS = 32
+'''The maximum number of columns fetched concurrently (larger values are capped).'''
+
+# The pool keeps a connection per worker, so that each request reuses one.
+http = urllib3.PoolManager(maxsize=MAX_WORKERS)
+
 FROM_POSTAL_TYPE = {
-    'u8': 'B',
-    'u16': 'H',
-    'u32': 'L',
-    'u64': 'Q',
-    's8': 'b',
-    's16': 'h',
-    's32': 'l',
-    'float': 'f',
-    'double': 'd',
+    'u8': '<u1',
+    'u16': '<u2',
+    'u32': '<u4',
+    'u64': '<u8',
+    's8': '<i1',
+    's16': '<i2',
+    's32': '<i4',
+    'float': '<f4',
+    'double': '<f8',
 }
 
-MEM_LIMIT = 1500000000
+Column = collections.namedtuple('Column', ['t', 'v'])
+'''A time series stored as two contiguous NumPy arrays of timestamps and values.'''
+
+ENCODING = 2
+'''The encoding requested from the server (1 for the original format, 2 for delta encoding).'''
+
+BATCH_KEYS = 64
+'''The maximum number of columns fetched in a single request.'''
+
+ANNOTATIONS_PAGE = 10000
+'''The maximum number of annotations fetched in a single request.'''
+
+READ_SIZE = 65536
+'''The number of bytes read from the network at once, before decoding them.'''
+
+CHUNK_ROWS = 65536
+'''The default number of rows of the chunks yielded by PostalRun.iter_chunks().'''
+
+FOLLOW_INTERVAL = 10
+'''The default time between two polls of PostalRun.follow(), in seconds.'''
+
+CACHE_LIMIT = 1500000000
+'''The default budget for the columns cached by a PostalRun, in bytes.'''
+
+DISK_CACHE_DIR = os.environ.get('POSTAL_CACHE_DIR', None)
+'''The directory for caching columns on disk, or None to disable it.'''
+
+DISK_CACHE_LIMIT = 10 * 1024 * 1024 * 1024
+'''The default budget for the columns cached on disk, in bytes.'''
+
+def _unpack_integers(data, count, offset):
+    '''Unpack integers packed with the smallest width fitting all of them.
+
+       Args:
+          data (bytearray): The buffer.
+          count (int): The number of integers.
+          offset (int): The offset of the width in the buffer.
+
+       Returns:
+          The integers (NumPy array of int64) and the offset past them.
+    '''
+    width = data[offset]
+    values = numpy.frombuffer(data, dtype=f'<i{width}', count=count, offset=offset + 1)
+    return values.astype('<i8'), offset + 1 + values.nbytes
+
+def _decode_block(data, columns, offset):
+    '''Decode one block of the batch encoding, see fetch.py for the layout.
+
+       Args:
+          data (bytearray): The buffer.
+          columns (list): A list of (key, dtype) tuples.
+          offset (int): The offset of the block in the buffer.
+
+       Returns:
+          The timestamps, a list of (validity, values) per column, and the
+          offset past the block.
+    '''
+    rows = int(numpy.frombuffer(data, dtype='<u4', count=1, offset=offset)[0])
+    offset += 4
+    t = numpy.frombuffer(data, dtype='<f8', count=rows, offset=offset)
+    offset += t.nbytes
+    values = list()
+    for _, dtype in columns:
+        bitmap = numpy.frombuffer(data, dtype='u1', count=(rows + 7) // 8, offset=offset)
+        offset += bitmap.nbytes
+        v = numpy.frombuffer(data, dtype=dtype, count=rows, offset=offset)
+        offset += v.nbytes
+        values.append((numpy.unpackbits(bitmap, count=rows, bitorder='little').astype(bool), v))
+    return t, values, offset
+
+def _decode_delta_block(data, columns, offset):
+    '''Decode one block of the delta (version 2) encoding, see fetch.py for the layout.
+
+       Args:
+          data (bytearray): The buffer.
+          columns (list): A list of (key, dtype) tuples.
+          offset (int): The offset of the block in the buffer.
+
+       Returns:
+          The timestamps, a list of (validity, values) per column, and the
+          offset past the block.
+    '''
+    rows = int(numpy.frombuffer(data, dtype='<u4', count=1, offset=offset)[0])
+    offset += 4
+    if rows == 0:
+        return numpy.empty(0, dtype='<f8'), [(numpy.empty(0, dtype=bool),
+                                              numpy.empty(0, dtype=dtype))
+                                             for _, dtype in columns], offset
+
+    # The integer arithmetic wraps around like the server's.
+    bits = numpy.empty(rows, dtype='<i8')
+    bits[0] = numpy.frombuffer(data, dtype='<i8', count=1, offset=offset)[0]
+    dod, offset = _unpack_integers(data, rows - 1, offset + 8)
+    numpy.cumsum(numpy.cumsum(dod), out=bits[1:])
+    bits[1:] += bits[0]
+    t = bits.view('<f8')
+
+    values = list()
+    for _, dtype in columns:
+        bitmap = numpy.frombuffer(data, dtype='u1', count=(rows + 7) // 8, offset=offset)
+        offset += bitmap.nbytes
+        valid = numpy.unpackbits(bitmap, count=rows, bitorder='little').astype(bool)
+
+        if dtype.kind == 'f':
+            planes = numpy.frombuffer(data, dtype='u1', count=rows * dtype.itemsize,
+                                      offset=offset)
+            offset += planes.nbytes
+            xors = numpy.ascontiguousarray(planes.reshape(dtype.itemsize, rows).T) \
+                .view(f'<u{dtype.itemsize}').reshape(rows)
+            v = numpy.bitwise_xor.accumulate(xors).view(dtype)
+        else:
+            v = numpy.empty(rows, dtype='<i8')
+            v[0] = numpy.frombuffer(data, dtype='<i8', count=1, offset=offset)[0]
+            deltas, offset = _unpack_integers(data, rows - 1, offset + 8)
+            numpy.cumsum(deltas, out=v[1:])
+            v[1:] += v[0]
+            v = v.astype(dtype)
+        values.append((valid, v))
+    return t, values, offset
+
+def _block_end(data, columns, offset, delta):
+    '''Find the end of a block of the batch or delta encoding, if it is complete.
+
+       Args:
+          data (bytearray): The buffer.
+          columns (list): A list of (key, dtype) tuples.
+          offset (int): The offset of the block in the buffer.
+          delta (bool): Whether the block uses the delta (version 2) encoding.
+
+       Returns:
+          The offset past the block, or None if the buffer ends before it.
+    '''
+    if offset + 4 > len(data):
+        return None
+    rows = int(numpy.frombuffer(data, dtype='<u4', count=1, offset=offset)[0])
+    end = offset + 4
+    bitmap = (rows + 7) // 8
+
+    if not delta:
+        end += rows * 8 + sum([bitmap + rows * dtype.itemsize for _, dtype in columns])
+        return end if end <= len(data) else None
+    if rows == 0:
+        return end
+
+    def skip_integers(end):
+        # The first value (8 bytes), then the packed deltas.
+        end += 8
+        if end >= len(data):
+            return None
+        return end + 1 + (rows - 1) * data[end]
+
+    end = skip_integers(end)
+    for _, dtype in columns:
+        if end is None:
+            return None
+        end += bitmap
+        if dtype.kind == 'f':
+            end += rows * dtype.itemsize
+        else:
+            end = skip_integers(end)
+    return end if end is not None and end <= len(data) else None
+
+def _concatenate(pieces, dtype):
+    '''Concatenate pieces of a time series.
+
+       Args:
+          pieces (list): The Column pieces, in order.
+          dtype (numpy.dtype): The type of the values.
+
+       Returns:
+          The Column.
+    '''
+    if len(pieces) == 1:
+        return pieces[0]
+    if not pieces:
+        return Column(numpy.empty(0, dtype='<f8'), numpy.empty(0, dtype=dtype))
+    return Column(numpy.concatenate([piece.t for piece in pieces]),
+                  numpy.concatenate([piece.v for piece in pieces]))
+
+def _slice(series, interval):
+    '''Slice the rows of a time series within a time interval.
+
+       Args:
+          series (Column): The time series.
+          interval (tuple): The (start, end) interval, end excluded.
+
+       Returns:
+          The Column (views of the arrays of the time series).
+    '''
+    start, end = numpy.searchsorted(series.t, interval)
+    return Column(series.t[start:end], series.v[start:end])
+
+def _missing_intervals(interval, intervals):
+    '''Find the parts of a time interval not covered by other intervals.
+
+       Args:
+          interval (tuple): The (start, end) interval.
+          intervals (list): The sorted list of disjoint (start, end) intervals.
+
+       Returns:
+          The sorted list of (start, end) intervals missing.
+    '''
+    start, end = interval
+    missing = list()
+    for lo, hi in intervals:
+        if hi <= start:
+            continue
+        if lo >= end:
+            break
+        if lo > start:
+            missing.append((start, lo))
+        start = max(start, hi)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+def _merge_intervals(series, intervals, pieces):
+    '''Merge time series holding disjoint time intervals.
+
+       Args:
+          series (Column): The time series, or None.
+          intervals (list): The sorted list of disjoint (start, end) intervals
+             held by the time series.
+          pieces (list): A list of ((start, end), Column) tuples, the intervals
+             being disjoint from the ones of the time series.
+
+       Returns:
+          The merged Column, and the sorted list of disjoint intervals it holds
+          (the adjacent ones being coalesced).
+    '''
+    pieces = sorted(pieces, key=lambda piece: piece[0])
+    if series is None:
+        series = Column(numpy.empty(0, dtype='<f8'), numpy.empty(0, dtype=pieces[0][1].v.dtype))
+
+    # Insert each piece where its interval starts.
+    parts = list()
+    index = 0
+    for (start, _), piece in pieces:
+        split = numpy.searchsorted(series.t, start)
+        parts += [Column(series.t[index:split], series.v[index:split]), piece]
+        index = split
+    parts.append(Column(series.t[index:], series.v[index:]))
+    series = _concatenate([part for part in parts if len(part.t) > 0] or parts[:1],
+                          series.v.dtype)
+
+    merged = list()
+    for start, end in sorted(intervals + [interval for interval, _ in pieces]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return series, merged
 
-def DataFrame(run, keys):
+def DataFrame(run, keys, workers=FETCH_WORKERS):
     '''Wrapper function to create a Pandas DataFrame
 
        Args:
           run (PostalRun): The run to fetch data from.
           keys (list): A list of keys to put in the DataFrame.
+          workers (int): The number of keys to fetch concurrently.
 
        Returns:
           (pandas.DataFrame): DataFrame of the selected data.
     '''
     series = {}
-    for key in keys:
-        series[key] = pandas.Series(dict(run[key]))
+    for key, column in run._get_columns(keys, workers).items():
+        series[key] = pandas.Series(column.v, index=column.t)
     return pandas.DataFrame(series)
 
+class ColumnCache:
+    '''A least recently used cache of columns, bounded by their size in bytes.
+
+       Plain NumPy arrays (such as the masks of valid values) can be cached
+       too. A column can hold the data of some time intervals only, which are
+       recorded along with it.
+
+       Public attributes:
+         limit: The budget for the cached columns, in bytes.
+         size: The size of the cached columns, in bytes.
+         hits: The number of lookups that found a cached column.
+         misses: The number of lookups that did not find a cached column.
+         evictions: The number of columns evicted to stay within the budget.
+    '''
+
+    def __init__(self, limit=CACHE_LIMIT):
+        '''Initialize the state of the object.
+
+           Args:
+              limit (int): The budget for the cached columns, in bytes.
+
+           Returns:
+              Nothing.
+        '''
+        self.limit = limit
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Ordered from the least recently used to the most recently used.
+        self._entries = collections.OrderedDict()
+
+        # The time intervals held by the columns, when recorded.
+        self._intervals = dict()
+
+    @staticmethod
+    def _sizeof(column):
+        if isinstance(column, numpy.ndarray):
+            return column.nbytes
+        return column.t.nbytes + column.v.nbytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def get(self, key):
+        '''Look up a column and mark it as the most recently used.
+
+           Args:
+              key: The cache key.
+
+           Returns:
+              The cached Column, or None.
+        '''
+        column = self._entries.get(key, None)
+        if column is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return column
+
+    def intervals(self, key):
+        '''Look up the time intervals held by a column.
+
+           Args:
+              key: The cache key.
+
+           Returns:
+              The sorted list of disjoint (start, end) intervals, or None if
+              the column is not cached or its intervals are not recorded.
+        '''
+        return self._intervals.get(key, None)
+
+    def put(self, key, column, intervals=None):
+        '''Insert a column, evicting the least recently used columns as needed.
+
+           A column larger than the whole budget is not cached.
+
+           Args:
+              key: The cache key.
+              column (Column): The column to cache.
+              intervals (list): The sorted list of disjoint (start, end) time
+                 intervals held by the column, if relevant.
+
+           Returns:
+              Nothing.
+        '''
+        self.discard(key)
+
+        size = self._sizeof(column)
+        if size > self.limit:
+            return
+
+        while self._entries and self.size + size > self.limit:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._intervals.pop(evicted_key, None)
+            self.size -= self._sizeof(evicted)
+            self.evictions += 1
+
+        self._entries[key] = column
+        if intervals is not None:
+            self._intervals[key] = intervals
+        self.size += size
+
+    def discard(self, key):
+        '''Remove a column from the cache, if present.
+
+           Args:
+              key: The cache key.
+
+           Returns:
+              Nothing.
+        '''
+        column = self._entries.pop(key, None)
+        self._intervals.pop(key, None)
+        if column is not None:
+            self.size -= self._sizeof(column)
+
+    def clear(self):
+        '''Remove all columns from the cache.
+
+           Returns:
+              Nothing.
+        '''
+        self._entries.clear()
+        self._intervals.clear()
+        self.size = 0
+
+class DiskCache:
+    '''A persistent cache of columns, bounded by their size in bytes.
+
+       Each column is stored in its own file, which is memory-mapped when read:
+       a JSON header line (padded to 64 bytes) followed by the timestamps and
+       the values. Files are written to a temporary file first and renamed
+       into place, so that several processes can safely share the cache.
+
+       Public attributes:
+         path: The directory holding the cached columns.
+         limit: The budget for the cached columns, in bytes.
+    '''
+
+    SUFFIX = '.column'
+
+    def __init__(self, path, limit=DISK_CACHE_LIMIT):
+        '''Initialize the state of the object.
+
+           Args:
+              path (str): The directory holding the cached columns.
+              limit (int): The budget for the cached columns, in bytes.
+
+           Returns:
+              Nothing.
+        '''
+        self.path = path
+        self.limit = limit
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + DiskCache.SUFFIX)
+
+    def __contains__(self, url):
+        return os.path.exists(self._path(url))
+
+    def get(self, url):
+        '''Look up the column fetched from an URL.
+
+           Args:
+              url (str): The URL the column was fetched from.
+
+           Returns:
+              A tuple (str, Column) of the ETag and the column, or None.
+        '''
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+            offset = len(header) + (-len(header) % 64)
+            header = json.loads(header.decode('utf-8'))
+
+            # Mark as the most recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        rows = header['rows']
+        if rows == 0:
+            return header['etag'], Column(numpy.empty(0, dtype='<f8'),
+                                          numpy.empty(0, dtype=FROM_POSTAL_TYPE[header['type']]))
+
+        t = numpy.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(rows,))
+        v = numpy.memmap(path, dtype=FROM_POSTAL_TYPE[header['type']], mode='r',
+                         offset=offset + t.nbytes, shape=(rows,))
+        return header['etag'], Column(t, v)
+
+    def put(self, url, etag, ty, column):
+        '''Store the column fetched from an URL.
+
+           Args:
+              url (str): The URL the column was fetched from.
+              etag (str): The ETag returned by the server for the column.
+              ty (str): The Postal type of the values.
+              column (Column): The column to store.
+
+           Returns:
+              Nothing.
+        '''
+        header = json.dumps({
+            'url': url,
+            'etag': etag,
+            'type': ty,
+            'rows': len(column.t),
+        }).encode('utf-8') + b'\n'
+        header += b' ' * (-len(header) % 64)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(column.t.astype('<f8', copy=False).tobytes())
+                f.write(column.v.astype(FROM_POSTAL_TYPE[ty], copy=False).tobytes())
+            os.replace(temp_path, self._path(url))
+        except OSError:
+            # The entry may be in use by another process (on Windows).
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        self._evict()
+
+    def _evict(self):
+        '''Remove the least recently used columns to stay within the budget.
+
+           Returns:
+              Nothing.
+        '''
+        entries = list()
+        size = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(DiskCache.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            size += stat.st_size
+
+        entries.sort()
+        for _, entry_size, path in entries:
+            if size <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already evicted by another process, or in use (on Windows).
+                pass
+            size -= entry_size
+
 class PostalRun:
     '''This object represents a Postal dataset.
 
        Public attributes:
          run_id: The run (dataset) ID.
-         start_time: The requested start time for the data (or None).
-         end_time: The requested end time for the data (or None).
+         start_time: The requested start time for the data (or None), see set_time_range().
+         end_time: The requested end time for the data (or None), see set_time_range().
          columns: A list of columns (keys).
          annotations: A dictionary of annotations.
+         cache: The ColumnCache holding the fetched data.
+         disk_cache: The DiskCache holding the fetched data across sessions (or None).
     '''
 
     @classmethod
@@ -94,11 +647,15 @@ class PostalRun:
         return cls.auth_user, cls.auth_password
 
     def __init__(self, postal_run, start_time=None, end_time=None,
-                 auth_user=None, auth_password=None):
+                 auth_user=None, auth_password=None, cache_limit=CACHE_LIMIT,
+                 disk_cache=DISK_CACHE_DIR):
         '''Initialize the state of the object.
 
            Args:
               postal_run (int): The ID of the run (dataset) in Postal.
+              cache_limit (int): The budget for caching data, in bytes.
+              disk_cache (str or DiskCache): The directory (or DiskCache) for
+                                             caching data on disk, or None.
 
            Returns:
               Nothing.
@@ -110,43 +667,85 @@ class PostalRun:
         if auth_user is None or auth_password is None:
             auth_user, auth_password = PostalRun.get_auth()
         self.headers = urllib3.util.make_headers(basic_auth=f'{auth_user}:{auth_password}')
-        self._check_auth(auth_user)
 
+        # The authentication, metadata, columns and annotations are checked or
+        # fetched on first use, see the properties below. The first three come
+        # from a single request.
+        self._auth_user = auth_user
+        self._auth_checked = False
         self._metadata = None
-        self._fetch_metadata()
+        self._columns = None
+        self._info = None
+        self._annotations = None
 
-        self.columns = None
-        self._fetch_columns()
-
-        self.annotations = None
-        self._fetch_annotations()
+        # Raw data and the masks of valid values share the cache, keyed by
+        # ('raw', key) and ('mask', key, valid version, time window)
+        # respectively. The data is cached along with the time intervals it
+        # holds, so that changing the time window only fetches what is missing.
+        self.cache = ColumnCache(cache_limit)
 
-        self._fetched = dict()
+        if isinstance(disk_cache, str):
+            disk_cache = DiskCache(disk_cache)
+        self.disk_cache = disk_cache
 
         self._enable_translate = False
+        self._enable_columnar = False
 
-        self._filtered = dict()
         self._enable_filter = False
+        self._valid_values = frozenset([0])
+        self._valid_version = 0
+
+    @property
+    def metadata(self):
+        '''The raw metadata dictionary of the run, fetched on first access.'''
+        self._fetch_info()
+        return self._metadata
+
+    @property
+    def columns(self):
+        '''The list of available columns (keys) of the run, fetched on first access.'''
+        self._fetch_info()
+        return self._columns
+
+    @property
+    def info(self):
+        '''The SQL types of the columns ('types'), the first and last timestamps
+           ('start' and 'end') and the approximate number of rows ('rows') of
+           the run, fetched on first access (empty with older servers).'''
+        self._fetch_info()
+        return self._info
+
+    @property
+    def annotations(self):
+        '''The annotations of the run indexed by timestamp, fetched on first access.'''
+        self._fetch_annotations()
+        return self._annotations
 
-        self._valid_map = self._metadata.get('valid_map', dict())
-
-        self._lru = list()
+    @property
+    def _valid_map(self):
+        return self.metadata.get('valid_map', dict())
 
-    def _check_auth(self, auth_user):
-        '''Check that authentication works.
+    def _check_auth(self):
+        '''Check that authentication works, once.
 
            Returns:
               Nothing.
         '''
+
+        # Use cache.
+        if self._auth_checked:
+            return
+
         url = f'{POSTAL_HOST}/cgi-bin/get-user.py'
         request = http.request('GET', url, headers=self.headers)
-        if request.data.decode('utf-8') != auth_user:
+        if request.data.decode('utf-8') != self._auth_user:
             if request.status != 200:
                 print(request.data.decode('utf-8'), file=sys.stderr)
             assert False, 'Failed to authenticate'
+        self._auth_checked = True
 
-    def _fetch_metadata(self):
-        '''Populate the metadata from this run.
+    def _fetch_info(self):
+        '''Populate the metadata, columns and bounds of this run, in one request.
 
            Returns:
               Nothing.
@@ -158,34 +757,50 @@ class PostalRun:
 
         params = {
             'd': self.run_id,
-            'raw': 1,
         }
         encoded_params = urllib.parse.urlencode(params)
-        url = f'{POSTAL_HOST}/cgi-bin/fetch-metadata.py?{encoded_params}'
+        url = f'{POSTAL_HOST}/cgi-bin/fetch-info.py?{encoded_params}'
         request = http.request('GET', url, headers=self.headers)
 
-        self._metadata = json.loads(request.data.decode('utf-8'))
-        if 'restricted' in self._metadata and self._metadata['restricted']:
+        if request.status == 404:
+            # Servers predating fetch-info.py.
+            self._check_auth()
+            self._fetch_legacy_info()
+            return
+
+        if request.status != 200:
+            raise Exception(f'Error fetching dataset: HTTP {request.status}\n' +
+                            request.data.decode('utf-8', 'replace'))
+
+        info = json.loads(request.data.decode('utf-8'))
+        if info.get('user') != self._auth_user:
+            assert False, 'Failed to authenticate'
+        self._auth_checked = True
+
+        if 'restricted' in info and info['restricted']:
             raise Exception('Error accessing dataset: you do not have permissions to access the dataset')
 
-        # Translate enums that are indexed by strings to indexing by integers.
-        for key, translation in self._metadata['enums'].items():
-            if isinstance(translation, dict):
-                new_translation = dict()
-                for value, string in translation.items():
-                    new_translation[int(value)] = string
-                self._metadata['enums'][key] = new_translation
+        self._columns = info['columns']
+        self._info = {field: info[field] for field in ('types', 'start', 'end', 'rows')}
+        self._set_metadata(info['metadata'])
 
-    def _fetch_columns(self):
-        '''Populate the list of available columns (keys) from this run.
+    def _fetch_legacy_info(self):
+        '''Populate the metadata and columns of this run, with one request each.
 
            Returns:
               Nothing.
         '''
+        params = {
+            'd': self.run_id,
+            'raw': 1,
+        }
+        encoded_params = urllib.parse.urlencode(params)
+        url = f'{POSTAL_HOST}/cgi-bin/fetch-metadata.py?{encoded_params}'
+        request = http.request('GET', url, headers=self.headers)
 
-        # Use cache.
-        if self.columns is not None:
-            return
+        metadata = json.loads(request.data.decode('utf-8'))
+        if 'restricted' in metadata and metadata['restricted']:
+            raise Exception('Error accessing dataset: you do not have permissions to access the dataset')
 
         params = {
             'd': self.run_id,
@@ -194,7 +809,29 @@ class PostalRun:
         url = f'{POSTAL_HOST}/cgi-bin/fetch-columns.py?{encoded_params}'
         request = http.request('GET', url, headers=self.headers)
 
-        self.columns = json.loads(request.data.decode('utf-8'))
+        self._columns = json.loads(request.data.decode('utf-8'))
+        self._info = dict()
+        self._set_metadata(metadata)
+
+    def _set_metadata(self, metadata):
+        '''Store the metadata of this run.
+
+           Args:
+              metadata (dict): The raw metadata, as stored on the server.
+
+           Returns:
+              Nothing.
+        '''
+
+        # Translate enums that are indexed by strings to indexing by integers.
+        metadata.setdefault('enums', dict())
+        for key, translation in metadata['enums'].items():
+            if isinstance(translation, dict):
+                new_translation = dict()
+                for value, string in translation.items():
+                    new_translation[int(value)] = string
+                metadata['enums'][key] = new_translation
+        self._metadata = metadata
 
     def _fetch_annotations(self):
         '''Fetch annotations from the run.
@@ -204,190 +841,969 @@ class PostalRun:
         '''
 
         # Use cache.
-        if self.annotations is not None:
+        if self._annotations is not None:
             return
+        self._check_auth()
 
+        # Only fetch the requested interval, one page at a time.
         params = {
             'd': self.run_id,
+            'limit': ANNOTATIONS_PAGE,
         }
-        encoded_params = urllib.parse.urlencode(params)
-        url = f'{POSTAL_HOST}/cgi-bin/fetch-annotations.py?{encoded_params}'
-        request = http.request('GET', url, headers=self.headers)
+        if self.start_time:
+            params['start'] = self.start_time
+        if self.end_time:
+            params['end'] = self.end_time
+
+        annotations = dict()
+        while True:
+            encoded_params = urllib.parse.urlencode(params)
+            url = f'{POSTAL_HOST}/cgi-bin/fetch-annotations.py?{encoded_params}'
+            request = http.request('GET', url, headers=self.headers)
+            annotations.update(json.loads(request.data.decode('utf-8')))
+
+            cursor = request.headers.get('X-Postal-Next-Cursor')
+            if cursor is None:
+                break
+            params['cursor'] = cursor
+        self._annotations = annotations
+
+    def _cache_key(self, key, filtered=False):
+        '''Get the key caching the data for a given column (key).
+
+           Args:
+              filtered (bool): Whether the data is filtered by the server.
+
+           Returns:
+              The cache key (tuple).
+        '''
+        if filtered:
+            return ('filtered', key, self._valid_version)
+        return ('raw', key)
 
-        self.annotations = json.loads(request.data.decode('utf-8'))
+    def _mask_key(self, key):
+        '''Get the key caching the mask of the valid values of a given column (key).
 
-        # Trim to the requested interval.
-        for t in list(self.annotations.keys()):
-            if ((self.start_time and float(t) < self.start_time) or
-                (self.end_time and float(t) >= self.end_time)):
-                del self.annotations[t]
+           Returns:
+              The cache key (tuple).
+        '''
+        return ('mask', key, self._valid_version, self._window())
+
+    def _window(self):
+        '''Get the time window of the run.
+
+           Returns:
+              The (start, end) interval, end excluded (infinite when not set).
+        '''
+        return (self.start_time if self.start_time else -math.inf,
+                self.end_time if self.end_time else math.inf)
+
+    def _lookup(self, cache_key):
+        '''Look up a column in the cache, for the time window of the run.
+
+           Returns:
+              The cached Column (or None), the intervals it holds, and the
+              intervals of the window missing from it.
+        '''
+        window = self._window()
+        series = self.cache.get(cache_key)
+        intervals = self.cache.intervals(cache_key)
+        if series is None or intervals is None:
+            return None, [], [window]
+        return series, intervals, _missing_intervals(window, intervals)
+
+    def _is_cached(self, cache_key):
+        '''Check whether a column is cached for the whole time window of the run.
+
+           Returns:
+              True if it is.
+        '''
+        intervals = self.cache.intervals(cache_key)
+        return intervals is not None and not _missing_intervals(self._window(), intervals)
 
-    def _fetch_data(self, key):
+    def _fetch_data(self, key, filtered=False):
         '''Fetch data for a given column (key) from the run.
 
+           Only the parts of the time window of the run that are not cached
+           yet are downloaded, and merged into the cache.
+
+           Args:
+              filtered (bool): Whether to have the data filtered by the server.
+
            Returns:
-              Nothing.
+              The Column.
         '''
 
-        self._fetch_columns()
+        self._fetch_info()
         assert key in self.columns
 
         # Use cache.
-        if key in self._fetched:
-            return
+        cache_key = self._cache_key(key, filtered)
+        series, intervals, missing = self._lookup(cache_key)
+        if missing:
+            pieces = [(interval, self._download(key, filtered, interval=interval))
+                      for interval in missing]
+            series, intervals = _merge_intervals(series, intervals, pieces)
+            self.cache.put(cache_key, series, intervals)
+        return _slice(series, self._window())
+
+    def _fetch_many_data(self, keys, workers, filtered=False):
+        '''Fetch data for several columns (keys) from the run, concurrently.
+
+           Args:
+              filtered (bool): Whether to have the data filtered by the server.
+
+           Returns:
+              A dictionary of Column, indexed by key.
+        '''
 
-        # Keep memory under control.
-        process = psutil.Process(os.getpid())
-        while len(self._lru) >= 3 and process.memory_info().rss > MEM_LIMIT:
-            # Kick out the least recently used piece of data.
-            least_used_key = self._lru[-1]
-            del self._fetched[least_used_key]
-            if least_used_key in self._filtered:
-                del self._filtered[least_used_key]
-            self._lru.remove(least_used_key)
-            gc.collect()
+        self._fetch_info()
+        workers = min(workers, MAX_WORKERS)
+
+        # Use cache, and only download the parts of the time window missing
+        # from it, grouping the columns missing the same interval.
+        cached = dict()
+        missing = collections.defaultdict(list)
+        for key in dict.fromkeys(keys):
+            assert key in self.columns
+
+            series, intervals, missing_intervals = self._lookup(self._cache_key(key, filtered))
+            cached[key] = (series, intervals)
+            for interval in missing_intervals:
+                missing[interval].append(key)
+
+        # Columns cached on disk only need to be revalidated one by one, the
+        # other ones are split into batches fetched in a single request each.
+        batches = list()
+        for interval, interval_keys in missing.items():
+            if self.disk_cache is not None:
+                on_disk = set(key for key in interval_keys
+                              if self._url([key], interval,
+                                           **self._fetch_params(filtered)) in self.disk_cache)
+                batches += [(interval, [key]) for key in interval_keys if key in on_disk]
+                interval_keys = [key for key in interval_keys if key not in on_disk]
+            batch_size = min(BATCH_KEYS, max(1, -(-len(interval_keys) // workers)))
+            for index in range(0, len(interval_keys), batch_size):
+                batches.append((interval, interval_keys[index:index + batch_size]))
+
+        def download(batch):
+            interval, batch_keys = batch
+            return interval, self._download_many(batch_keys, filtered, interval=interval)
+
+        # The HTTP connection pool is shared, and decompression releases the
+        # GIL, so threads are enough to overlap the downloads.
+        pieces = collections.defaultdict(list)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for interval, batch in executor.map(download, batches):
+                for key, series in batch.items():
+                    pieces[key].append((interval, series))
+
+        fetched = dict()
+        window = self._window()
+        for key, (series, intervals) in cached.items():
+            if key in pieces:
+                series, intervals = _merge_intervals(series, intervals, pieces[key])
+                self.cache.put(self._cache_key(key, filtered), series, intervals)
+            fetched[key] = _slice(series, window)
+        return fetched
+
+    def _url(self, keys, interval=None, **extra_params):
+        '''Build the URL to fetch data for one or more columns (keys).
 
+           Args:
+              interval (tuple): The (start, end) interval to fetch, the time
+                  window of the run by default.
+              extra_params: Additional parameters for fetch.py.
+
+           Returns:
+              The URL (str).
+        '''
         params = {
             'd': self.run_id,
-            'key': key,
+            'key': keys,
+            **extra_params,
         }
-        if self.start_time:
-            params['start'] = self.start_time
-        if self.end_time:
-            params['end'] = self.end_time
-        encoded_params = urllib.parse.urlencode(params)
-        url = f'{POSTAL_HOST}/cgi-bin/fetch.py?{encoded_params}'
-        request = http.request('GET', url, headers=self.headers,
-                               preload_content=False)
+        start, end = interval if interval is not None else self._window()
+        if start != -math.inf:
+            params['start'] = start
+        if end != math.inf:
+            params['end'] = end
+        encoded_params = urllib.parse.urlencode(params, doseq=True)
+        return f'{POSTAL_HOST}/cgi-bin/fetch.py?{encoded_params}'
 
-        if 'Content-Length' in request.headers:
-            length = request.headers['Content-Length']
-        else:
-            length = 8192
+    def _fetch_params(self, filtered=False, since=None):
+        '''Build the parameters of a request to fetch data.
+
+           Args:
+              filtered (bool): Whether to have the data filtered by the server.
+              since (float): Only fetch the rows after this time.
+
+           Returns:
+              The parameters (dict), see _url().
+        '''
+        params = {'encoding': ENCODING}
+        if filtered:
+            params['filter'] = 1
+            params['valid'] = sorted(self._valid_values)
+        if since is not None:
+            params['since'] = repr(since)
+        return params
 
-        if ENABLE_COMPRESSION:
-            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
+    def _fetch_headers(self):
+        '''Build the headers for a request to fetch data.
 
-        # Fetch the data
+           Returns:
+              The headers (dict).
+        '''
+        headers = dict(self.headers)
+        headers['X-Postal-Codecs'] = ','.join(CODECS if ENABLE_COMPRESSION else ['none'])
+        return headers
+
+    @staticmethod
+    def _fetch_error(request, reason):
+        '''Build the error raised when a fetch request fails.
+
+           Args:
+              request (urllib3.HTTPResponse): The response.
+              reason (str): What went wrong.
+
+           Returns:
+              The Exception.
+        '''
+        return Exception(f'Error fetching data from {request.geturl()} ' +
+                         f'(HTTP {request.status}): {reason}')
+
+    def _iter_response(self, request):
+        '''Read and decompress the response to a fetch request, as it arrives.
+
+           The connection is released when done, and closed if the response
+           was not read until the end.
+
+           Yields:
+              The decompressed data, in pieces (bytes).
+        '''
+        if request.status != 200:
+            reason = request.data.decode('utf-8', 'replace')
+            request.release_conn()
+            raise self._fetch_error(request, reason)
+
+        # Servers predating codec negotiation only compress with LZMA.
+        codec = request.headers.get('X-Postal-Codec', 'lzma' if ENABLE_COMPRESSION else 'none')
+        decompress = DECOMPRESSORS[codec]()
+
+        # Return the data as soon as some arrives (with urllib3 2), for the
+        # live streams.
+        read = getattr(request, 'read1', request.read)
+
+        done = False
+        try:
+            while True:
+                buf = read(READ_SIZE)
+                if len(buf) == 0:
+                    break
+
+                data = decompress(buf)
+                if data:
+                    yield data
+            done = True
+        finally:
+            if not done:
+                request.close()
+            request.release_conn()
+
+    def _read(self, request):
+        '''Read and decompress the whole response to a fetch request.
+
+           Returns:
+              The decompressed data (bytearray).
+        '''
         decoded_data = bytearray()
-        while True:
-            buf = request.read(length)
-            if len(buf) == 0:
-                break
+        for data in self._iter_response(request):
+            decoded_data += data
+        return decoded_data
 
-            if ENABLE_COMPRESSION:
-                decoded_data += decompressor.decompress(buf)
-            else:
-                decoded_data += buf
+    def _decode_stream(self, request, key=None):
+        '''Decode the response to a fetch request, as it arrives.
 
-        offset = 0
+           The records are decoded as soon as they are complete, and the
+           partial records at the end of a piece are carried over to the next
+           one.
+
+           Args:
+              request (urllib3.HTTPResponse): The response, not read yet.
+              key (str): The key fetched, for the original encoding of a
+                  single column.
+
+           Yields:
+              A dictionary of the types indexed by key, then a dictionary of
+              Column indexed by key for each group of records decoded.
+        '''
+        chunks = self._iter_response(request)
+
+        # Parse the first line: the header describing the columns, or the type
+        # of the single column for the original encoding.
+        buffer = bytearray()
+        while b'\n' not in buffer:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buffer += chunk
+        if b'\n' not in buffer:
+            raise self._fetch_error(request, 'truncated response')
+        offset = buffer.index(b'\n') + 1
+
+        if buffer.startswith(b'{'):
+            header = json.loads(buffer[:offset - 1].decode('utf-8'))
+            types = {column['key']: column['type'] for column in header['columns']}
+            columns = [(column['key'], numpy.dtype(FROM_POSTAL_TYPE[column['type']]))
+                       for column in header['columns']]
+            delta = header.get('encoding', 1) == 2
+            decode_block = _decode_delta_block if delta else _decode_block
+
+            def decode(buffer, offset):
+                # Decode each complete block, see fetch.py for the layout, and
+                # split the aligned frame into one column per key, without the
+                # NULLs.
+                series = {key: list() for key, _ in columns}
+                while True:
+                    end = _block_end(buffer, columns, offset, delta)
+                    if end is None:
+                        break
+                    t, values, offset = decode_block(buffer, columns, offset)
+                    for (key, _), (valid, v) in zip(columns, values):
+                        series[key].append(Column(t[valid], v[valid]))
+                return {key: _concatenate(series[key], dtype)
+                        for key, dtype in columns if series[key]}, offset
+        else:
+            ty = buffer[:offset - 1].decode('ascii')
+            types = {key: ty}
+            dtype = numpy.dtype([('t', '<f8'), ('v', FROM_POSTAL_TYPE[ty])])
+
+            def decode(buffer, offset):
+                # Decode all the complete records at once, and split them into
+                # contiguous arrays.
+                count = (len(buffer) - offset) // dtype.itemsize
+                if count == 0:
+                    return dict(), offset
+                records = numpy.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+                series = Column(numpy.ascontiguousarray(records['t']),
+                                numpy.ascontiguousarray(records['v']))
+                return {key: series}, offset + records.nbytes
+
+        yield types
 
-        # Parse the data type.
-        ty = ''
         while True:
-            c = chr(decoded_data[offset])
-            offset += 1
-            if c == '\n':
+            series, offset = decode(buffer, offset)
+            if series:
+                yield series
+
+            # The decoded arrays are copies, so the buffer can be replaced by
+            # the partial record left, if any.
+            chunk = next(chunks, None)
+            if chunk is None:
                 break
-            ty += c
+            buffer = buffer[offset:]
+            buffer += chunk
+            offset = 0
+
+        if offset != len(buffer):
+            raise self._fetch_error(request, 'truncated response')
+
+    def _decode(self, request, key=None):
+        '''Decode the whole response to a fetch request.
 
-        unpacker = struct.Struct('<d{}'.format(FROM_POSTAL_TYPE[ty]))
+           Args:
+              request (urllib3.HTTPResponse): The response, not read yet.
+              key (str): The key fetched, see _decode_stream().
 
-        # Now decode the values.
-        series = list()
-        while offset < len(decoded_data):
-            t, v = unpacker.unpack_from(decoded_data, offset=offset)
-            offset += unpacker.size
-            series.append((t, v))
+           Returns:
+              A dictionary of the types, and a dictionary of Column, both
+              indexed by key.
+        '''
+        stream = self._decode_stream(request, key)
+        types = next(stream)
+        pieces = {key: list() for key in types}
+        for series in stream:
+            for key, column in series.items():
+                pieces[key].append(column)
+        return types, {key: _concatenate(pieces[key], numpy.dtype(FROM_POSTAL_TYPE[ty]))
+                       for key, ty in types.items()}
 
-        request.release_conn()
+    def _download(self, key, filtered=False, since=None, interval=None):
+        '''Download data for a given column (key) from the server.
 
-        self._fetched[key] = series
+           This method does not use the in-memory cache, and is safe to call
+           from multiple threads.
 
-        # Add to the head of the LRU list.
-        self._lru.insert(0, key)
+           Args:
+              filtered (bool): Whether to have the data filtered by the server.
+              since (float): Only download the rows after this time.
+              interval (tuple): The (start, end) interval to download, see
+                  _url().
 
-    def _filter_data(self, key):
-        '''Filter data for a given column (key) from the run.
+           Returns:
+              The Column.
+        '''
+        url = self._url([key], interval, **self._fetch_params(filtered, since))
+
+        # Revalidate the copy cached on disk, if any. The new rows of a column
+        # are not cached on their own.
+        disk_cache = self.disk_cache if since is None else None
+        headers = self._fetch_headers()
+        cached = disk_cache.get(url) if disk_cache is not None else None
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+
+        request = http.request('GET', url, headers=headers,
+                               preload_content=False)
+
+        if cached is not None and request.status == 304:
+            request.release_conn()
+            return cached[1]
+
+        # The data is decoded as it is downloaded.
+        types, series = self._decode(request, key)
+        ty, series = types[key], series[key]
+
+        if disk_cache is not None and 'ETag' in request.headers:
+            disk_cache.put(url, request.headers['ETag'], ty, series)
+
+        return series
+
+    def _download_many(self, keys, filtered=False, since=None, interval=None):
+        '''Download data for several columns (keys) in a single request.
+
+           This method does not use the in-memory cache, and is safe to call
+           from multiple threads.
+
+           Args:
+              filtered (bool): Whether to have the data filtered by the server.
+              since (float): Only download the rows after this time.
+              interval (tuple): The (start, end) interval to download, see
+                  _url().
 
            Returns:
-              Nothing.
+              A dictionary of Column, indexed by key.
         '''
+        if len(keys) == 1:
+            return {keys[0]: self._download(keys[0], filtered, since, interval)}
 
-        self._fetch_columns()
-        assert key in self.columns
+        params = self._fetch_params(filtered, since)
+        request = http.request('GET', self._url(keys, interval, **params),
+                               headers=self._fetch_headers(),
+                               preload_content=False)
+        types, series = self._decode(request)
 
-        # Use cache.
-        if key in self._filtered:
-            return
+        # The ETag is the same for all the columns of a dataset, so each
+        # column is cached on disk as if it was downloaded on its own, see
+        # _download().
+        if self.disk_cache is not None and since is None and 'ETag' in request.headers:
+            for key, column in series.items():
+                self.disk_cache.put(self._url([key], interval, **params),
+                                    request.headers['ETag'], types[key], column)
+
+        return series
 
-        self._fetch_data(key)
-        self._update_lru(key)
+    def _filter_on_server(self, key):
+        '''Whether to have the data for a given column (key) filtered by the server.
+
+           The data is filtered locally when the valid values are given by a
+           function, or when the data and its validity are already cached.
+
+           Returns:
+              True to filter on the server.
+        '''
+        validity_key = self.get_validity_key(key)
+        if validity_key is None or callable(self._valid_values):
+            return False
+        return not (self._mask_key(key) in self.cache or
+                    (self._is_cached(('raw', key)) and self._is_cached(('raw', validity_key))))
+
+    def _filter_data(self, key, fetched=None):
+        '''Filter data for a given column (key) from the run.
+
+           Args:
+              fetched (dict): Data already fetched, indexed by cache key.
+
+           Returns:
+              The filtered Column.
+        '''
+        def fetch(key):
+            if fetched is not None and ('raw', key) in fetched:
+                return fetched[('raw', key)]
+            return self._fetch_data(key)
+
+        self._fetch_info()
+        assert key in self.columns
 
         validity_key = self.get_validity_key(key)
         if validity_key is None:
-            series = self._fetched[key]
-        else:
-            # Filter the value accordingly.
-            self._fetch_data(validity_key)
-            self._update_lru(validity_key)
+            return fetch(key)
 
-            series = list()
+        filtered_key = self._cache_key(key, filtered=True)
+        if fetched is not None and filtered_key in fetched:
+            return fetched[filtered_key]
+        elif fetched is None and self._filter_on_server(key):
+            return self._fetch_data(key, filtered=True)
 
-            valid_index = 0
-            t_valid, v_valid = self._fetched[validity_key][valid_index]
+        data = fetch(key)
 
-            for t, v in self._fetched[key]:
-                while t_valid < t:
-                    valid_index += 1
-                    assert valid_index < len(self._fetched[validity_key])
-                    t_valid, v_valid = self._fetched[validity_key][valid_index]
+        # The mask of valid values is cached rather than the filtered column,
+        # so that the timestamps are not duplicated. The raw column may have
+        # been fetched again with more data since (recording dataset).
+        cache_key = self._mask_key(key)
+        mask = self.cache.get(cache_key)
+        if mask is None or len(mask) != len(data.t):
+            mask = self._mask(data, fetch(validity_key))
+            self.cache.put(cache_key, mask)
 
-                assert t == t_valid
-                if v_valid == 0:
-                    series.append((t, v))
+        return Column(data.t[mask], data.v[mask])
 
-        self._filtered[key] = series
+    def _mask(self, data, valid):
+        '''Compute the mask of the valid values of a column.
 
-    def _update_lru(self, key):
-        '''Update the LRU list for the specified key.
+           Args:
+              data (Column): The data of the column.
+              valid (Column): The data of its validity key.
 
            Returns:
-               Nothing.
+              The mask (NumPy array of bool).
         '''
-        # Move the key to the head of the list.
-        assert key in self._lru
-        self._lru.remove(key)
-        self._lru.insert(0, key)
+        # Look up the validity at each timestamp of the data. Values without
+        # validity at the same timestamp are filtered out.
+        if len(valid.t) == 0:
+            return numpy.zeros(len(data.t), dtype=bool)
+
+        index = numpy.minimum(numpy.searchsorted(valid.t, data.t), len(valid.t) - 1)
+        validity = valid.v[index]
+        if callable(self._valid_values):
+            mask = numpy.asarray(self._valid_values(validity), dtype=bool)
+        else:
+            mask = numpy.isin(validity, list(self._valid_values))
+        mask &= valid.t[index] == data.t
+        return mask
 
-    def __getitem__(self, key):
-        def translate(series):
-            if self._enable_translate and key in self._metadata['enums']:
-                translation = self._metadata['enums'][key]
-
-                if isinstance(translation, dict):
-                    return [(t, translation.get(v, f'Unknown value {v}'))
-                            for (t, v) in series]
-                else:
-                    def translate_single(value):
-                        if value < len(translation):
-                            return translation[value]
-                        return f'Unknown value {value}'
-                    return [(t, translate_single(v)) for (t, v) in series]
-            return series
+    def _get_column(self, key, fetched=None, since=None):
+        '''Get the data for a given column (key), fetching it if needed.
 
+           Args:
+               fetched (dict): Data already fetched, indexed by cache key.
+               since (float): Only get the rows after this time.
+
+           Returns:
+               A Column, with enums translated and data filtered as requested.
+        '''
         if not self._enable_filter:
-            self._fetch_data(key)
-            self._update_lru(key)
-            return translate(self._fetched[key])
+            if fetched is not None and ('raw', key) in fetched:
+                series = fetched[('raw', key)]
+            else:
+                series = self._fetch_data(key)
         else:
-            self._filter_data(key)
-            return translate(self._filtered[key])
+            series = self._filter_data(key, fetched)
+
+        if since is not None:
+            start = numpy.searchsorted(series.t, since, side='right')
+            series = Column(series.t[start:], series.v[start:])
+        return self._translate(key, series)
+
+    def _translate(self, key, series):
+        '''Translate the enums of a column (key), if requested.
+
+           Args:
+               series (Column): The data of the column.
+
+           Returns:
+               The Column, with the values translated if needed.
+        '''
+        if self._enable_translate and key in self.metadata['enums']:
+            translation = self.metadata['enums'][key]
+
+            if isinstance(translation, dict):
+                def translate_single(value):
+                    return translation.get(value, f'Unknown value {value}')
+            else:
+                def translate_single(value):
+                    if value < len(translation):
+                        return translation[value]
+                    return f'Unknown value {value}'
+            values = numpy.empty(len(series.v), dtype=object)
+            values[:] = [translate_single(v) for v in series.v.tolist()]
+            return Column(series.t, values)
+        return series
+
+    def _fetch_for(self, keys, workers):
+        '''Fetch the data needed to get several columns (keys), concurrently.
+
+           Returns:
+               A dictionary of Column, indexed by cache key.
+        '''
+        raw_keys = list()
+        filtered_keys = list()
+        for key in keys:
+            validity_key = self.get_validity_key(key) if self._enable_filter else None
+            if validity_key is not None and self._filter_on_server(key):
+                filtered_keys.append(key)
+                continue
+
+            raw_keys.append(key)
+            if validity_key is not None and self._mask_key(key) not in self.cache:
+                raw_keys.append(validity_key)
+
+        fetched = {('raw', key): series
+                   for key, series in self._fetch_many_data(raw_keys, workers).items()}
+        fetched.update({self._cache_key(key, filtered=True): series
+                        for key, series in self._fetch_many_data(filtered_keys, workers,
+                                                                 filtered=True).items()})
+        return fetched
+
+    def _get_columns(self, keys, workers):
+        '''Get the data for several columns (keys), fetching them concurrently.
+
+           Returns:
+               A dictionary of Column, indexed by key.
+        '''
+        fetched = self._fetch_for(keys, workers)
+        return {key: self._get_column(key, fetched) for key in keys}
+
+    def _format(self, series):
+        '''Format a Column as requested.
+
+           Returns:
+               The Column, or a list of (timestamp, value) tuples.
+        '''
+        if self._enable_columnar:
+            return series
+        return list(zip(series.t.tolist(), series.v.tolist()))
+
+    def __getitem__(self, key):
+        return self._format(self._get_column(key))
+
+    def fetch_many(self, keys, workers=FETCH_WORKERS):
+        '''Fetch data for several keys concurrently.
+
+           Args:
+               keys (list): A list of keys to fetch.
+               workers (int): The number of keys to fetch concurrently.
+
+           Returns:
+               A dictionary indexed by key, with the same values as run[key].
+        '''
+        return {key: self._format(series)
+                for key, series in self._get_columns(keys, workers).items()}
+
+    def downsample(self, key, points):
+        '''Fetch a downsampled view of the data for a key.
+
+           The server splits the requested interval into (up to) the specified
+           number of buckets, and summarizes each bucket by its first, last,
+           minimum and maximum values (M4), so that spikes are preserved. Enums
+           are not translated and data is not filtered.
+
+           Args:
+               key (str): The key to fetch.
+               points (int): The number of buckets.
+
+           Returns:
+               A NumPy structured array with one entry per non-empty bucket, with
+               fields t_first, t_last, first, last, min, max, mean and count.
+        '''
+        self._fetch_info()
+        assert key in self.columns
+
+        request = http.request('GET', self._url([key], points=points),
+                               headers=self._fetch_headers(),
+                               preload_content=False)
+        decoded_data = self._read(request)
+
+        # Parse the data type.
+        if b'\n' not in decoded_data:
+            raise self._fetch_error(request, 'truncated response')
+        offset = decoded_data.index(b'\n') + 1
+        ty = decoded_data[:offset - 1].decode('ascii')
+
+        dtype = numpy.dtype([
+            ('t_first', '<f8'),
+            ('t_last', '<f8'),
+            ('first', FROM_POSTAL_TYPE[ty]),
+            ('last', FROM_POSTAL_TYPE[ty]),
+            ('min', FROM_POSTAL_TYPE[ty]),
+            ('max', FROM_POSTAL_TYPE[ty]),
+            ('mean', '<f8'),
+            ('count', '<u8'),
+        ])
+        return numpy.frombuffer(decoded_data, dtype=dtype, offset=offset).copy()
+
+    def iter_chunks(self, key, rows=CHUNK_ROWS, dataframe=False):
+        '''Fetch the data for a key in chunks, decoded as it is downloaded.
+
+           Unlike run[key], the data is neither cached nor held in memory at
+           once, so columns larger than the memory can be processed, and the
+           processing can start before the end of the download. Enums are
+           translated and data is filtered as requested.
+
+           Args:
+               key (str): The key to fetch.
+               rows (int): The number of rows of each chunk (the last one may
+                   have less).
+               dataframe (bool): Whether to yield Pandas DataFrames rather
+                   than the same values as run[key].
+
+           Yields:
+               The chunks, in order of time.
+        '''
+        self._fetch_info()
+        assert key in self.columns
+
+        # The data is filtered by the server, unless the valid values are
+        # given by a function: the validity key is then fetched (and cached)
+        # first.
+        validity_key = self.get_validity_key(key) if self._enable_filter else None
+        valid = None
+        if validity_key is not None and callable(self._valid_values):
+            valid = self._fetch_data(validity_key)
+        filtered = validity_key is not None and valid is None
+
+        request = http.request('GET', self._url([key], **self._fetch_params(filtered)),
+                               headers=self._fetch_headers(),
+                               preload_content=False)
+        stream = self._decode_stream(request, key)
+        dtype = numpy.dtype(FROM_POSTAL_TYPE[next(stream)[key]])
+
+        def to_chunk(series):
+            series = self._translate(key, series)
+            if dataframe:
+                return pandas.DataFrame({key: pandas.Series(series.v, index=series.t)})
+            return self._format(series)
+
+        # The decoded records are split into chunks of the requested size, the
+        # ones left are carried over to the next chunk.
+        pending = list()
+        pending_rows = 0
+        for series in stream:
+            series = series[key]
+            if valid is not None:
+                mask = self._mask(series, valid)
+                series = Column(series.t[mask], series.v[mask])
+            pending.append(series)
+            pending_rows += len(series.t)
+            if pending_rows < rows:
+                continue
+
+            series = _concatenate(pending, dtype)
+            end = pending_rows - pending_rows % rows
+            for index in range(0, end, rows):
+                yield to_chunk(Column(series.t[index:index + rows], series.v[index:index + rows]))
+            pending = [Column(series.t[end:], series.v[end:])]
+            pending_rows -= end
+
+        if pending_rows > 0:
+            yield to_chunk(_concatenate(pending, dtype))
+
+    def refresh(self, keys=None, workers=FETCH_WORKERS):
+        '''Fetch the rows appended to a recording dataset into the cache.
+
+           Only the rows after the last one of each cached column are
+           downloaded, and appended to it. Columns that are not cached, or
+           cached for a time window with an end time only, are left alone:
+           they are fetched as needed when accessed.
+
+           Args:
+               keys (list): The keys to refresh (with their validity keys),
+                   all the cached ones by default.
+               workers (int): The number of keys to fetch concurrently.
+
+           Returns:
+               The keys with new rows (set).
+        '''
+        self._fetch_info()
+        workers = min(workers, MAX_WORKERS)
+
+        wanted = None
+        if keys is not None:
+            wanted = set(keys)
+            if self._enable_filter:
+                wanted.update([self.get_validity_key(key) for key in keys])
+
+        # The filtered columns are only refreshed for the current valid
+        # values, and the masks of the valid values are recomputed when their
+        # column grows (see _filter_data()). The new rows are fetched from
+        # the start of the last interval held by each column, when it has no
+        # end, and after its last row within it.
+        columns = dict()
+        for cache_key in self.cache:
+            if cache_key[0] != 'raw' and cache_key != self._cache_key(cache_key[1], filtered=True):
+                continue
+            if wanted is not None and cache_key[1] not in wanted:
+                continue
+            intervals = self.cache.intervals(cache_key)
+            if not intervals or intervals[-1][1] != math.inf:
+                continue
+            series = self.cache.get(cache_key)
+            if series is not None:
+                start = intervals[-1][0]
+                last = float(series.t[-1]) if len(series.t) > 0 else None
+                columns[cache_key] = (series, intervals, start,
+                                      last if last is not None and last >= start else None)
+
+        # The columns filtered alike are fetched in batches, from the earliest
+        # of their last rows. The columns without rows are fetched apart, in
+        # full.
+        groups = collections.defaultdict(list)
+        for cache_key, (_, _, start, last) in columns.items():
+            groups[(cache_key[0] == 'filtered', start, last is not None)].append(cache_key)
+        batches = list()
+        for (filtered, start, _), cache_keys in groups.items():
+            batch_size = min(BATCH_KEYS, max(1, -(-len(cache_keys) // workers)))
+            for index in range(0, len(cache_keys), batch_size):
+                batch = cache_keys[index:index + batch_size]
+                lasts = [columns[cache_key][3] for cache_key in batch
+                         if columns[cache_key][3] is not None]
+                batches.append((batch, filtered, (start, math.inf),
+                                min(lasts) if lasts else None))
+
+        def download(batch):
+            cache_keys, filtered, interval, since = batch
+            return cache_keys, self._download_many([cache_key[1] for cache_key in cache_keys],
+                                                   filtered, since, interval)
+
+        refreshed = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for cache_keys, fetched in executor.map(download, batches):
+                for cache_key in cache_keys:
+                    series, intervals, _, last = columns[cache_key]
+                    new = fetched[cache_key[1]]
+                    if last is not None:
+                        start = numpy.searchsorted(new.t, last, side='right')
+                        new = Column(new.t[start:], new.v[start:])
+                    if len(new.t) > 0:
+                        self.cache.put(cache_key, _concatenate([series, new], series.v.dtype),
+                                       intervals)
+                        refreshed.add(cache_key[1])
+        return refreshed
+
+    def follow(self, keys, interval=FOLLOW_INTERVAL, workers=FETCH_WORKERS):
+        '''Follow a recording dataset, polling it for new rows forever.
+
+           The keys are fetched in full first, then refreshed (see refresh())
+           at the given interval.
+
+           Args:
+               keys (list): The keys to follow.
+               interval (float): The time between two polls, in seconds.
+               workers (int): The number of keys to fetch concurrently.
+
+           Yields:
+               After each poll, a dictionary indexed by key with the same
+               values as run[key], but only for the new rows (all of them the
+               first time). The keys without new rows are left out.
+        '''
+        fetched = self._fetch_for(keys, workers)
+        last = dict()
+        while True:
+            new = dict()
+            for key in keys:
+                series = self._get_column(key, fetched, since=last.get(key))
+                if len(series.t) > 0:
+                    last[key] = float(series.t[-1])
+                    new[key] = self._format(series)
+            yield new
+
+            time.sleep(interval)
+            self.refresh(keys, workers)
+            fetched = None
+
+    def stream(self, keys=None):
+        '''Stream the rows of a recording dataset as they are imported.
+
+           The server pushes the new rows as soon as they are committed, which
+           is cheaper and faster than polling it (see follow()). Only the rows
+           imported after the start of the stream are received. The stream
+           never ends, unless the server stops it.
+
+           Args:
+               keys (list): The keys to stream, all of them by default.
+
+           Yields:
+               For each batch of rows imported, a dictionary indexed by key
+               with the same values as run[key], but only for the new rows. The
+               keys without new rows are left out.
+        '''
+        self._fetch_info()
+        keys = list(self.columns) if keys is None else keys
+
+        # The validity keys are streamed too, to filter the data locally.
+        validity_keys = dict()
+        if self._enable_filter:
+            for key in keys:
+                validity_key = self.get_validity_key(key)
+                if validity_key is not None:
+                    validity_keys[key] = validity_key
+        streamed = list(dict.fromkeys(keys + list(validity_keys.values())))
+
+        params = urllib.parse.urlencode({'d': self.run_id, 'key': streamed}, doseq=True)
+        request = http.request('GET', f'{POSTAL_HOST}/cgi-bin/stream.py?{params}',
+                               headers=self._fetch_headers(),
+                               preload_content=False)
+        if request.status != 200:
+            request.release_conn()
+            raise Exception('Error streaming dataset: live streams are not available ' +
+                            f'on the server (HTTP {request.status}), see follow()')
+
+        stream = self._decode_stream(request)
+        next(stream)
+        for series in stream:
+            new = dict()
+            for key in keys:
+                column = series.get(key)
+                if column is None or len(column.t) == 0:
+                    continue
+                if key in validity_keys:
+                    valid = series.get(validity_keys[key], Column(numpy.empty(0), numpy.empty(0)))
+                    mask = self._mask(column, valid)
+                    column = Column(column.t[mask], column.v[mask])
+                    if len(column.t) == 0:
+                        continue
+                new[key] = self._format(self._translate(key, column))
+            if new:
+                yield new
+
+    def prefetch(self, keys, workers=FETCH_WORKERS):
+        '''Fetch data for several keys concurrently into the cache.
+
+           Args:
+               keys (list): A list of keys to fetch.
+               workers (int): The number of keys to fetch concurrently.
+
+           Returns:
+               Nothing.
+        '''
+        self._fetch_for(keys, workers)
 
     def __iter__(self):
-        self._fetch_columns()
+        self._fetch_info()
         return iter(self.columns)
 
+    def set_time_range(self, start_time=None, end_time=None):
+        '''Change the time window of the data (and annotations) of the run.
+
+           The data already cached is kept: only the parts of the new time
+           window that are not cached yet are fetched, so zooming in is free
+           and panning only fetches the rows newly in view.
+
+           Args:
+               start_time (float): The new start time (or None).
+               end_time (float): The new end time, excluded (or None).
+
+           Returns:
+               The previous (start_time, end_time) tuple.
+        '''
+        previous = (self.start_time, self.end_time)
+        self.start_time = start_time
+        self.end_time = end_time
+        if (start_time, end_time) != previous:
+            self._annotations = None
+        return previous
+
     def set_translate(self, enable=True):
         '''Enable translation of enums when accessing data.
 
@@ -401,6 +1817,23 @@ class PostalRun:
         self._enable_translate = enable
         return was_enabled
 
+    def set_columnar(self, enable=True):
+        '''Enable columnar results when accessing data.
+
+           When enabled, a time series is returned as a Column, holding a NumPy
+           array of timestamps (t) and a NumPy array of values (v), instead of a
+           list of tuples.
+
+           Args:
+               enable (bool): Whether to enable columnar results.
+
+           Returns:
+               The previous state.
+        '''
+        was_enabled = self._enable_columnar
+        self._enable_columnar = enable
+        return was_enabled
+
     def get_translation(self, key):
         '''Get the translation (list or dictionary) for a key.
 
@@ -410,19 +1843,27 @@ class PostalRun:
            Returns:
                The translation (list or dict) or None.
         '''
-        return self._metadata['enums'].get(key, None)
+        return self.metadata['enums'].get(key, None)
 
-    def set_filter(self, enable=True):
+    def set_filter(self, enable=True, valid=None):
         '''Enable filtering by validity key when accessing data.
 
            Args:
                enable (bool): Whether to enable filtering by validity key.
+               valid: The values of the validity key for which data is valid,
+                      either a collection of values or a function taking a
+                      NumPy array of values and returning a boolean array.
+                      By default, the valid values are unchanged (initially,
+                      only 0 is valid).
 
            Returns:
                The previous state.
         '''
         was_enabled = self._enable_filter
         self._enable_filter = enable
+        if valid is not None:
+            self._valid_values = valid if callable(valid) else frozenset(valid)
+            self._valid_version += 1
         return was_enabled
 
     def get_validity_key(self, key):
@@ -6,22 +6,92 @@ import postal
 
 if __name__ == '__main__':
     import argparse
+    import concurrent.futures
     import fnmatch
     import getpass
     import gzip
     import json
     import logging
+    import lzma
+    import mmap
+    import numpy
     import os.path
     import platform
     import socket
     import sys
     import tarfile
+    import threading
+    import time
     import traceback
     import urllib.parse
     import urllib3
-    from zstandard import ZstdDecompressor
+    from zstandard import ZstdCompressor, ZstdDecompressor
+    try:
+        import lz4.frame
+    except ImportError:
+        lz4 = None
     http = urllib3.PoolManager()
 
+    STREAM_CHUNK = 4 * 1024 * 1024
+    '''The size of the chunks of data sent to Postal.'''
+
+    DECOMPRESSORS = {
+        '.csv': None,
+        '.csv.gz': lambda f: gzip.GzipFile(fileobj=f),
+        '.csv.xz': lambda f: lzma.LZMAFile(f),
+        '.csv.zst': lambda f: ZstdDecompressor().stream_reader(f),
+    }
+    '''The supported input files, and how to read them.'''
+
+    class ProgressMeter():
+        '''A thread-safe meter reporting the throughput of an import.
+        '''
+        def __init__(self, verbose):
+            '''Constructor.
+
+               Args:
+                 verbose (bool): Whether to log the progress instead of
+                   updating a status line.
+            '''
+            self.verbose = verbose
+            self.bytes = 0
+            self.rows = 0
+            self._lock = threading.Lock()
+            self._start = time.monotonic()
+            self._last_report = self._start
+
+        def update(self, size, rows):
+            '''Account for data sent to Postal.
+
+               Args:
+                 size (int): The number of bytes sent.
+                 rows (int): The number of rows sent.
+            '''
+            with self._lock:
+                self.bytes += size
+                self.rows += rows
+                now = time.monotonic()
+                if now - self._last_report >= 1:
+                    self._last_report = now
+                    self._report(now)
+
+        def done(self):
+            '''Report the final throughput.
+            '''
+            self._report(time.monotonic())
+            if not self.verbose:
+                print()
+
+        def _report(self, now):
+            elapsed = max(now - self._start, 1e-6)
+            message = f'{self.bytes / 1e6:.1f} MB, {self.rows} rows ' + \
+                      f'({self.bytes / 1e6 / elapsed:.1f} MB/s, {self.rows / elapsed:.0f} rows/s)'
+            if self.verbose:
+                logging.getLogger(__name__).info(message)
+            else:
+                print(f'\r{message}', end='')
+                sys.stdout.flush()
+
     class CmdLine():
         '''A command-line tool to manipulate data from Postal.
         '''
@@ -35,6 +105,7 @@ if __name__ == '__main__':
 Available commands are:
    import     Import data into Postal
    export     Export data from Postal
+   benchmark  Compare the fetch time of the compression codecs
 ''')
             parser.add_argument('command',
                                 help='Subcommand to run')
@@ -54,7 +125,6 @@ Available commands are:
             self.sock = None
             self.verbose = False
             self.logger = logging.getLogger(__name__)
-            self.stream_raw_last_path = ''
             logging.basicConfig(
                 format='[%(asctime)s] %(levelname)s %(message)s',
                 level='INFO')
@@ -83,7 +153,12 @@ Available commands are:
             parser.add_argument(
                 '-c', '--connection',
                 nargs='?',
-                help='Specify a Postal connection [ip:]port')
+                help='Specify a Postal connection [ip:]port[/dataset]')
+            parser.add_argument(
+                '-j', '--jobs',
+                type=int,
+                default=4,
+                help='The number of files to import concurrently (when the server allows it)')
             parser.add_argument(
                 'data_files',
                 nargs='+',
@@ -95,7 +170,6 @@ Available commands are:
                 exit(1)
 
             self.verbose = args.verbose
-            self.processed = list()
 
             ip = postal.POSTAL_HOST.split('/')[2]
             if args.create:
@@ -115,6 +189,7 @@ Available commands are:
                 dataset = output['datasetId']
                 self.logger.info(f'Created dataset {dataset}...')
                 port = output['port']
+                handshake = output.get('handshake')
 
             else:
                 # If no connection is specified, prompt for the
@@ -125,59 +200,233 @@ Available commands are:
                 if ':' in port:
                     ip, port = port.split(':')
 
+                # A dataset is required when the port is shared by several
+                # datasets (ingest daemon).
+                handshake = None
+                if '/' in port:
+                    port, dataset = port.split('/')
+                    handshake = f'dataset {int(dataset)}'
+
+            # Skip the unsupported files upfront.
+            data_files = list()
+            for filepath in args.data_files:
+                if filepath.endswith(tuple(DECOMPRESSORS)):
+                    data_files.append(filepath)
+                else:
+                    print(f'Unknown file {filepath}, skipping',
+                          file=sys.stderr)
+
+            self.meter = ProgressMeter(self.verbose)
+            if handshake is not None:
+                # The ingest daemon accepts several connections to the same
+                # dataset: push one file per connection, several at a time.
+                def import_file(filepath):
+                    sock = self.connect(ip, port, handshake)
+                    try:
+                        self.stream_file(sock, filepath)
+                    finally:
+                        sock.close()
+
+                with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+                    for _ in executor.map(import_file, data_files):
+                        pass
+            else:
+                self.sock = self.connect(ip, port, handshake)
+                try:
+                    for filepath in data_files:
+                        self.stream_file(self.sock, filepath)
+                finally:
+                    self.sock.close()
+
+            self.meter.done()
+            print(f'Imported {self.meter.bytes} bytes ({self.meter.rows} rows) successfully.')
+
+        def connect(self, ip, port, handshake):
+            '''Open a connection to Postal for importing data.
+
+               Args:
+                 ip (str): The host to connect to.
+                 port (str): The TCP port to connect to.
+                 handshake (str): The line selecting the dataset, or None.
+
+               Returns the connected socket.
+            '''
             if self.verbose:
                 self.logger.info(f'Connecting to {ip}:{port}...')
 
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((ip, int(port)))
+            sock = socket.create_connection((ip, int(port)))
 
             if self.verbose:
                 self.logger.info(f'Opened connection to {ip}:{port}')
 
-            total_size = 0
-            for filepath in args.data_files:
-                if filepath.endswith('.csv'):
-                    try:
-                        with open(filepath, 'rb') as f:
-                            # These files can get really big, let's do it in
-                            # chunks.
-                            while True:
-                                contents = f.read(65536)
-                                if not contents:
-                                    break
-                                total_size += self.stream_raw(filepath, contents)
-
-                    except Exception:
-                        traceback.print_exc(file=sys.stderr)
-                        print(f'Failed to open {filepath}, skipping',
-                              file=sys.stderr)
-                else:
-                    print(f'Unknown file {filepath}, skipping',
-                          file=sys.stderr)
+            if handshake is not None:
+                sock.sendall(f'{handshake}\n'.encode('ascii'))
+            return sock
 
-            if not self.verbose:
-                print()
-            print(f'Imported {total_size} bytes successfully.')
+        def stream_file(self, sock, path):
+            '''Import a .csv file (optionally compressed) into Postal.
 
-        def stream_raw(self, path, contents):
-            '''Import a .log file into Postal.
+               Uncompressed files are sent with sendfile(), without copying the
+               data through Python. Compressed files are decompressed on the
+               fly.
 
                Args:
+                 sock (socket): The connection to Postal.
                  path (str): Path to the file to import.
-                 contents (bytes): Contents of the file to import.
 
                Returns the number of bytes streamed to Postal.
             '''
-            if not self.verbose:
-                print('.', end='')
-                sys.stdout.flush()
-            elif self.stream_raw_last_path != path:
+            if self.verbose:
                 self.logger.info(f'Pushing {path}...')
 
-            self.stream_raw_last_path = path
-            self.sock.send(contents)
+            total_size = 0
+            try:
+                decompressor = DECOMPRESSORS[next(
+                    suffix for suffix in DECOMPRESSORS if path.endswith(suffix))]
+                with open(path, 'rb') as f:
+                    if decompressor is None:
+                        size = os.fstat(f.fileno()).st_size
+                        contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                            if size else b''
+                        # These files can get really big, let's do it in
+                        # chunks to report the progress.
+                        try:
+                            while total_size < size:
+                                count = min(STREAM_CHUNK, size - total_size)
+                                sock.sendfile(f, total_size, count)
+                                self.meter.update(
+                                    count, contents[total_size:total_size + count].count(b'\n'))
+                                total_size += count
+                        finally:
+                            if size:
+                                contents.close()
+                    else:
+                        reader = decompressor(f)
+                        while True:
+                            contents = reader.read(STREAM_CHUNK)
+                            if not contents:
+                                break
+                            sock.sendall(contents)
+                            self.meter.update(len(contents), contents.count(b'\n'))
+                            total_size += len(contents)
+
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                print(f'Failed to import {path}, skipping',
+                      file=sys.stderr)
+
+            return total_size
+
+        def _benchmark(self):
+            '''Handler for the "benchmark" command.
+            '''
+            parser = argparse.ArgumentParser(
+                description='Compare the fetch time of the compression codecs')
+            parser.add_argument(
+                '--rows',
+                type=int,
+                default=1000000,
+                help='The number of rows of the synthetic dataset')
+            parser.add_argument(
+                '--bandwidth',
+                type=float,
+                default=10,
+                help='The network bandwidth assumed for the synthetic dataset, in Gbit/s')
+            parser.add_argument(
+                '-r', '--repeat',
+                type=int,
+                default=3,
+                help='The number of measurements to keep the best of')
+            parser.add_argument(
+                'dataset',
+                nargs='?',
+                help='The Postal dataset ID to fetch data from, instead of a synthetic dataset')
+            parser.add_argument(
+                'keys',
+                nargs='*',
+                help='One or more keys to fetch from the dataset')
+            args = parser.parse_args(sys.argv[2:])
+
+            print(f'{"codec":<6} {"ratio":>7} {"server":>9} {"network":>9} {"client":>9} {"total":>9}')
+            codec_order = list(postal.CODECS)
+            for codec in codec_order:
+                if args.dataset is not None:
+                    # End-to-end, against the server.
+                    postal.CODECS[:] = [codec]
+                    try:
+                        run = postal.PostalRun(args.dataset, disk_cache=None)
+                        run.set_columnar(True)
+                        total = float('inf')
+                        for _ in range(args.repeat):
+                            run.cache.clear()
+                            start = time.perf_counter()
+                            run.fetch_many(args.keys)
+                            total = min(total, time.perf_counter() - start)
+                    finally:
+                        postal.CODECS[:] = codec_order
+                    print(f'{codec:<6} {"-":>7} {"-":>9} {"-":>9} {"-":>9} {total:>8.3f}s')
+                else:
+                    # Model the stages of a fetch, with the encoding of the
+                    # server.
+                    ratio, server, network, client = self._benchmark_synthetic(
+                        codec, args.rows, args.bandwidth * 1e9 / 8, args.repeat)
+                    print(f'{codec:<6} {ratio:>6.1f}x {server:>8.3f}s {network:>8.3f}s ' +
+                          f'{client:>8.3f}s {server + network + client:>8.3f}s')
 
-            return len(contents)
+        def _benchmark_synthetic(self, codec, rows, bandwidth, repeat):
+            '''Measure the fetch of a synthetic column with a given codec.
+
+               The column is a regularly sampled, slowly varying signal, as
+               is typical of telemetry.
+
+               Args:
+                 codec (str): The codec to measure.
+                 rows (int): The number of rows of the column.
+                 bandwidth (float): The network bandwidth, in bytes/s.
+                 repeat (int): The number of measurements to keep the best of.
+
+               Returns a tuple with the compression ratio, then the times (in
+               seconds) to compress on the server, transfer and decode on the
+               client.
+            '''
+            t = 1.6e9 + numpy.arange(rows) * 0.1
+            v = numpy.round(20 + 5 * numpy.sin(numpy.arange(rows) / 1000), 2)
+            records = numpy.empty(rows, dtype=[('t', '<f8'), ('v', '<f8')])
+            records['t'] = t
+            records['v'] = v
+            raw = b'double\n' + records.tobytes()
+
+            compressors = {
+                'zstd': lambda: ZstdCompressor(level=3).compressobj(),
+                'lz4': lambda: lz4.frame.LZ4FrameCompressor(),
+                'lzma': lambda: lzma.LZMACompressor(format=lzma.FORMAT_ALONE),
+            }
+
+            server = client = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                if codec == 'none':
+                    encoded = raw
+                elif codec == 'lz4':
+                    compressor = compressors[codec]()
+                    encoded = compressor.begin() + compressor.compress(raw) + compressor.flush()
+                else:
+                    compressor = compressors[codec]()
+                    encoded = compressor.compress(raw) + compressor.flush()
+                server = min(server, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                decompress = postal.DECOMPRESSORS[codec]()
+                decoded = bytearray()
+                for offset in range(0, len(encoded), 65536):
+                    decoded += decompress(encoded[offset:offset + 65536])
+                offset = decoded.index(b'\n') + 1
+                column = numpy.frombuffer(decoded, dtype=records.dtype, offset=offset)
+                numpy.ascontiguousarray(column['t'])
+                numpy.ascontiguousarray(column['v'])
+                client = min(client, time.perf_counter() - start)
+
+            return len(raw) / len(encoded), server, len(encoded) / bandwidth, client
 
         def _export(self):
             '''Handler for the "export" command.
@@ -202,6 +451,11 @@ Available commands are:
                 '-f', '--filter',
                 action='store_true',
                 help='Filter by validity')
+            parser.add_argument(
+                '-j', '--jobs',
+                type=int,
+                default=postal.FETCH_WORKERS,
+                help=f'The number of keys to fetch concurrently (at most {postal.MAX_WORKERS})')
             parser.add_argument(
                 'dataset',
                 help='The Postal dataset ID to export data from')
@@ -234,7 +488,7 @@ Available commands are:
                             columns.append(column)
 
             # Do the export.
-            dataframe = postal.DataFrame(run, columns)
+            dataframe = postal.DataFrame(run, columns, workers=args.jobs)
             dataframe.to_csv(args.csv)
 
     cmd = CmdLine()
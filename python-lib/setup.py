@@ -8,6 +8,7 @@ setuptools.setup(
     description="The Postal API",
     long_description="The Postal API enables access to Postal datasets",
     packages=setuptools.find_packages(),
-    install_requires=['pandas', 'psutil', 'zstandard'],
+    install_requires=['numpy', 'pandas', 'zstandard'],
+    extras_require={'lz4': ['lz4']},
     python_requires='>=3.6',
 )
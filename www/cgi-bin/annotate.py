@@ -1,24 +1,17 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
-import MySQLdb
-import sys
+from endpoint import run_cgi
 
-from db import HOST, USER, PASSWORD, DB
+def handle(request):
+    request.start([('Content-Type', 'application/octet-stream')])
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.flush()
+    args = request.args
+    dataset = int(args['d'].value)
+    action = args['action'].value
+    id = args['id'].value
+    t = float(args['t'].value) if 't' in args else 0.0
+    text = args['text'].value if 'text' in args else ''
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
-action = args['action'].value
-id = args['id'].value
-t = float(args['t'].value) if 't' in args else 0.0
-text = args['text'].value if 'text' in args else ''
-
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
+    db = request.db
     db.autocommit(True)
     cursor = db.cursor()
 
@@ -32,6 +25,5 @@ try:
         query = f'DELETE FROM `annotation_{dataset}` WHERE `id` = %s;'
         cursor.execute(query, (id,))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
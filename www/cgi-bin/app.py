@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+'''
+A WSGI application serving the endpoints from a long-lived process.
+
+The endpoints are the same as the CGI scripts (see endpoint.py), but the
+interpreter, the modules and the connections to the database are reused across
+requests. With Apache, serve it with mod_wsgi (see the README). Executed
+directly, it serves the endpoints on a local port, without authentication, for
+testing.
+'''
+import argparse
+import importlib
+import os
+import queue
+import socketserver
+import sys
+import threading
+import wsgiref.simple_server
+
+import MySQLdb
+
+from endpoint import connect, Request
+
+POOL_SIZE = 8
+'''The maximum number of connections to the database.'''
+
+ENDPOINTS = [
+    'annotate',
+    'edit',
+    'fetch',
+    'fetch-annotations',
+    'fetch-columns',
+    'fetch-info',
+    'fetch-metadata',
+    'fetch-sharedata',
+    'get-user',
+    'get-version',
+    'is-admin',
+    'new',
+    'reset',
+    'restart',
+    'search',
+    'share',
+    'stream',
+    'trim',
+]
+'''The endpoints served, by name of the script (without the extension).'''
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE):
+        '''Constructor.
+
+           Args:
+               size (int): The maximum number of connections.
+        '''
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        '''Get a connection, waiting for one if all are in use.
+
+           Returns:
+               The connection (MySQLdb.Connection).
+        '''
+        self._slots.acquire()
+        try:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                return connect()
+            try:
+                db.ping()
+            except MySQLdb.OperationalError:
+                db = connect()
+            return db
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, db):
+        '''Return a connection to the pool.
+
+           The transaction is rolled back, so that the next request does not
+           see a stale snapshot of the database. A connection in a bad state
+           is closed instead.
+
+           Args:
+               db (MySQLdb.Connection): The connection.
+
+           Returns:
+               Nothing.
+        '''
+        try:
+            db.rollback()
+            db.autocommit(False)
+            self._idle.put(db)
+        except MySQLdb.Error:
+            db.close()
+        finally:
+            self._slots.release()
+
+class Application:
+    def __init__(self, pool_size=POOL_SIZE):
+        '''Constructor.
+
+           Args:
+               pool_size (int): The maximum number of connections to the
+                   database.
+        '''
+        self._pool = ConnectionPool(pool_size)
+
+    def __call__(self, environ, start_response):
+        name = environ.get('PATH_INFO', '').rsplit('/', 1)[-1]
+        if name.endswith('.py'):
+            name = name[:-len('.py')]
+        if name not in ENDPOINTS:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found\n']
+
+        # The scripts are only imported once.
+        handle = importlib.import_module(name).handle
+
+        request = Request(environ, environ['wsgi.input'], start_response,
+                          self._pool.acquire, self._pool.release)
+        try:
+            handle(request)
+        finally:
+            request.close()
+
+        # The response was written through the write() callable.
+        return []
+
+application = Application()
+'''The entry point for the WSGI servers (such as mod_wsgi).'''
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+    daemon_threads = True
+
+if __name__ == '__main__':
+    # Never start the server from a web request.
+    if 'GATEWAY_INTERFACE' in os.environ:
+        sys.stdout.write('Status: 403 Forbidden\n\n')
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=8000,
+                        help='The TCP port to listen on')
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help='The maximum number of connections to the database')
+    args = parser.parse_args()
+
+    server = wsgiref.simple_server.make_server('', args.port, Application(args.pool_size),
+                                               server_class=ThreadingWSGIServer)
+    server.serve_forever()
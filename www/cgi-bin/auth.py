@@ -1,4 +1,5 @@
 import os
+import threading
 
 try:
     from config import GROUPS
@@ -8,8 +9,15 @@ except ImportError:
 class RestrictedAccess(Exception):
     pass
 
+# The environment of the current request, which differs from the environment
+# of the process when served by the WSGI application (one thread per request).
+_request = threading.local()
+
+def set_environ(environ):
+    _request.environ = environ
+
 def get_username():
-    return os.environ.get('REMOTE_USER', 'guest')
+    return getattr(_request, 'environ', os.environ).get('REMOTE_USER', 'guest')
 
 def is_admin():
     user = get_username()
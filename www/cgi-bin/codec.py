@@ -0,0 +1,111 @@
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+ZSTD_LEVEL = 3
+'''The zstd compression level, favoring speed over ratio.'''
+
+class NullCompressor:
+    '''A compressor that passes the data through.'''
+    def compress(self, data):
+        return data
+
+    def sync(self):
+        return b''
+
+    def flush(self):
+        return b''
+
+class LZMACompressor:
+    '''The legacy LZMA compressor, which cannot output its pending data before
+       the end of the stream.'''
+    def __init__(self):
+        self._compressor = lzma.LZMACompressor(format=lzma.FORMAT_ALONE)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return b''
+
+    def flush(self):
+        return self._compressor.flush()
+
+class ZstdCompressor:
+    '''A streaming zstd compressor.'''
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self):
+        return self._compressor.flush()
+
+class LZ4Compressor:
+    '''A streaming LZ4 frame compressor, which outputs whole blocks as soon as
+       they are compressed.'''
+    def __init__(self):
+        self._compressor = lz4.frame.LZ4FrameCompressor(auto_flush=True)
+        self._started = False
+
+    def compress(self, data):
+        prefix = b''
+        if not self._started:
+            prefix = self._compressor.begin()
+            self._started = True
+        return prefix + self._compressor.compress(data)
+
+    def sync(self):
+        return b''
+
+    def flush(self):
+        return self.compress(b'') + self._compressor.flush()
+
+COMPRESSORS = {
+    'lzma': LZMACompressor,
+    'none': NullCompressor,
+}
+'''The available codecs, and how to create a compressor for each of them.
+
+   Besides compress() and flush() (which ends the stream), the compressors have
+   a sync() method returning the compressed data still pending, if the codec
+   allows to do so before the end of the stream.'''
+
+if zstandard is not None:
+    COMPRESSORS['zstd'] = ZstdCompressor
+if lz4 is not None:
+    COMPRESSORS['lz4'] = LZ4Compressor
+
+def negotiate(accepted, enable_compression=True):
+    '''Select the codec to use for a response.
+
+       Args:
+           accepted (str): The codecs accepted by the client, in order of
+               preference and separated by commas, or None for a legacy
+               client (which only accepts lzma or none, depending on the
+               configuration).
+           enable_compression (bool): Whether compression is allowed.
+
+       Returns:
+           The name of the codec (str).
+    '''
+    if accepted is None:
+        return 'lzma' if enable_compression else 'none'
+    if enable_compression:
+        for codec in accepted.split(','):
+            codec = codec.strip()
+            if codec in COMPRESSORS:
+                return codec
+    return 'none'
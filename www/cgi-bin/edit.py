@@ -1,26 +1,20 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
-import MySQLdb
-import sys
 
 from auth import protect_dataset
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
-project = args['project'].value.lower() if 'project' in args else None
-description = args['description'].value if 'description' in args else None
+    args = request.args
+    dataset = int(args['d'].value)
+    project = args['project'].value.lower() if 'project' in args else None
+    description = args['description'].value if 'description' in args else None
 
-# TODO: Migrate to POST if possible.
+    # TODO: Migrate to POST if possible.
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
+    db = request.db
     db.autocommit(True)
     cursor = db.cursor()
 
@@ -43,8 +37,7 @@ try:
         'description': row[1],
         'project': row[2].lower(),
     }
-    sys.stdout.write(json.dumps(results))
+    request.write(json.dumps(results))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
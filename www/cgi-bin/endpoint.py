@@ -0,0 +1,146 @@
+'''
+The interface between the endpoints and the web server.
+
+Each endpoint (script of this directory) defines a handle(request) function.
+Executed as a CGI script, it runs it with run_cgi() and a fresh connection to
+the database. The WSGI application (app.py) calls the same function with
+connections from a pool.
+'''
+import cgi
+import cgitb
+import os
+import sys
+
+import MySQLdb
+
+from auth import set_environ
+from db import HOST, USER, PASSWORD, DB
+
+def connect():
+    '''Open a connection to the database.
+
+       Returns:
+           The connection (MySQLdb.Connection).
+    '''
+    return MySQLdb.connect(HOST, USER, PASSWORD, DB)
+
+class Request:
+    def __init__(self, environ, input, start, acquire=connect, release=None):
+        '''Constructor.
+
+           Args:
+               environ (dict): The CGI environment of the request.
+               input (file): The body of the request (binary).
+               start (callable): Called with the status and the list of
+                   (name, value) headers, and returning a function writing
+                   the body of the response (bytes).
+               acquire (callable): Returns a connection to the database.
+               release (callable): Called with the connection when done (the
+                   connection is closed by default).
+        '''
+        self.environ = environ
+        self._input = input
+        self._start = start
+        self._write = None
+        self._acquire = acquire
+        self._release = release
+        self._args = None
+        self._db = None
+
+        # The user is looked up by auth.get_username().
+        set_environ(environ)
+
+    @property
+    def args(self):
+        '''The parameters of the request (cgi.FieldStorage).'''
+        if self._args is None:
+            self._args = cgi.FieldStorage(fp=self._input, environ=self.environ)
+        return self._args
+
+    @property
+    def db(self):
+        '''The connection to the database, opened on first use.'''
+        if self._db is None:
+            self._db = self._acquire()
+        return self._db
+
+    def read(self):
+        '''Read the body of the request.
+
+           Returns:
+               The body (bytes).
+        '''
+        length = self.environ.get('CONTENT_LENGTH')
+        return self._input.read(int(length)) if length else self._input.read()
+
+    def start(self, headers, status='200 OK'):
+        '''Start the response.
+
+           Args:
+               headers (list): The (name, value) headers of the response.
+               status (str): The status of the response.
+
+           Returns:
+               Nothing.
+        '''
+        self._write = self._start(status, headers)
+
+    def write(self, data):
+        '''Write (part of) the body of the response.
+
+           Args:
+               data (str or bytes): The data, encoded in UTF-8 if a string.
+
+           Returns:
+               Nothing.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data:
+            self._write(data)
+
+    def close(self):
+        '''Release the connection to the database, if any.
+
+           Returns:
+               Nothing.
+        '''
+        if self._db is not None:
+            db, self._db = self._db, None
+            if self._release is not None:
+                self._release(db)
+            else:
+                db.close()
+
+def run_cgi(handle):
+    '''Serve the current request as a CGI script.
+
+       Args:
+           handle (callable): The handler of the endpoint, taking the Request.
+
+       Returns:
+           Nothing.
+    '''
+    cgitb.enable()
+
+    output = sys.stdout.buffer
+
+    # The body is sent as it is written, for the streamed responses.
+    def write(data):
+        output.write(data)
+        output.flush()
+
+    def start(status, headers):
+        head = ''
+        if status != '200 OK':
+            head += f'Status: {status}\n'
+        head += ''.join([f'{name}: {value}\n' for name, value in headers]) + '\n'
+        write(head.encode('latin-1'))
+        return write
+
+    request = Request(os.environ, sys.stdin.buffer, start)
+    try:
+        handle(request)
+    finally:
+        sys.stdout.flush()
+        request.close()
@@ -1,39 +1,59 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
-import MySQLdb
-import sys
 
 from auth import protect_dataset
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    args = request.args
+    dataset = int(args['d'].value)
+    start = float(args['start'].value) if 'start' in args else None
+    end = float(args['end'].value) if 'end' in args else None
+    limit = int(args['limit'].value) if 'limit' in args else None
+    cursor_arg = args['cursor'].value if 'cursor' in args else None
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
-
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    cursor = db.cursor()
+    cursor = request.db.cursor()
 
     protect_dataset(cursor, dataset)
 
-    query = f'SELECT `t`, `id`, `text` FROM `annotation_{dataset}`;'
-    cursor.execute(query)
+    conditions = list()
+    query_args = list()
+    if start is not None:
+        conditions.append(f'`t` >= {start}')
+    if end is not None:
+        conditions.append(f'`t` < {end}')
+    if cursor_arg is not None:
+        # The cursor is the position of the last annotation of the previous
+        # page, in the (t, id) order.
+        cursor_t, cursor_id = cursor_arg.split('/', 1)
+        conditions.append('(`t` > %s OR (`t` = %s AND `id` > %s))')
+        query_args += [float(cursor_t), float(cursor_t), cursor_id]
+
+    query = f'SELECT `t`, `id`, `text` FROM `annotation_{dataset}`'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if limit is not None:
+        # One more row tells whether there is a next page.
+        query += f' ORDER BY `t`, `id` LIMIT {limit + 1}'
+    cursor.execute(query + ';', query_args or None)
 
     results = {}
     rows = cursor.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f'{rows[-1][0]!r}/{rows[-1][1]}'
     for row in rows:
         results[row[0]] = {
             'id': row[1],
             'text': row[2],
         }
 
-    sys.stdout.write(json.dumps(results))
+    headers = [('Content-Type', 'application/json')]
+    if next_cursor is not None:
+        headers.append(('X-Postal-Next-Cursor', next_cursor))
+    request.start(headers)
+    request.write(json.dumps(results))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -1,40 +1,22 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
-import MySQLdb
-import sys
 
 from auth import protect_dataset
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
+from metadata import load_schema
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
+    dataset = int(request.args['d'].value)
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    cursor = db.cursor()
+    cursor = request.db.cursor()
 
     protect_dataset(cursor, dataset)
 
-    describe = 'SELECT COLUMN_NAME FROM information_schema.columns ' + \
-               'WHERE `table_schema` = %s AND `table_name` = %s;'
-    cursor.execute(describe, (DB, f'dataset_{dataset}'))
+    columns = list(load_schema(cursor, dataset))
 
-    columns = []
-    rows = cursor.fetchall()
-    for row in rows:
-        column = row[0]
-        if column == 't':
-            continue
-        columns.append(column)
+    request.write(json.dumps(columns))
 
-    sys.stdout.write(json.dumps(columns))
-
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import json
+
+from auth import get_username, protect_dataset, RestrictedAccess
+from db import DB
+from endpoint import run_cgi
+from metadata import load_metadata, load_schema
+
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
+
+    args = request.args
+    dataset = int(args['d'].value)
+    with_annotations = 'annotations' in args and args['annotations'].value == '1'
+
+    cursor = request.db.cursor()
+
+    # Everything needed to open a dataset, in a single request.
+    info = {
+        'user': get_username(),
+    }
+
+    try:
+        protect_dataset(cursor, dataset)
+
+        info['metadata'] = load_metadata(cursor, dataset)
+        info['types'] = load_schema(cursor, dataset)
+        info['columns'] = list(info['types'])
+
+        # The bounds use the primary key, and the number of rows is the
+        # estimate of the storage engine (counting would scan the table). The
+        # tables do not exist until the importer receives the header, nor
+        # once the dataset is reset.
+        query = 'SELECT `table_rows` FROM information_schema.tables ' + \
+                'WHERE `table_schema` = %s AND `table_name` = %s;'
+        cursor.execute(query, (DB, f'dataset_{dataset}'))
+        table = cursor.fetchone()
+        if table is None:
+            info['start'], info['end'] = None, None
+            info['rows'] = 0
+        else:
+            info['rows'] = table[0]
+            cursor.execute(f'SELECT MIN(`t`), MAX(`t`) FROM `dataset_{dataset}`;')
+            info['start'], info['end'] = cursor.fetchone()
+
+        if with_annotations:
+            info['annotations'] = dict()
+            if table is not None:
+                cursor.execute(f'SELECT `t`, `id`, `text` FROM `annotation_{dataset}`;')
+                for row in cursor.fetchall():
+                    info['annotations'][row[0]] = {
+                        'id': row[1],
+                        'text': row[2],
+                    }
+
+    except RestrictedAccess:
+        info['restricted'] = 1
+
+    request.write(json.dumps(info))
+
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -1,22 +1,13 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
-import MySQLdb
-import sys
-
 from auth import protect_dataset, RestrictedAccess
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
+    dataset = int(request.args['d'].value)
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    cursor = db.cursor()
+    cursor = request.db.cursor()
 
     try:
         protect_dataset(cursor, dataset)
@@ -32,8 +23,7 @@ try:
     except RestrictedAccess:
         metadata = '{"restricted": 1}'
 
-    sys.stdout.write(metadata)
+    request.write(metadata)
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -1,28 +1,18 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
-import MySQLdb
-import sys
+from endpoint import run_cgi
 
-from db import HOST, USER, PASSWORD, DB
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+    shareid = request.args['s'].value
 
-args = cgi.FieldStorage()
-shareid = args['s'].value
-
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    cursor = db.cursor()
+    cursor = request.db.cursor()
 
     query = 'SELECT `sharedata` FROM `sharelinks` WHERE `id` = %s;'
     cursor.execute(query, (shareid,))
     sharedata = cursor.fetchone()[0]
 
-    sys.stdout.write(sharedata)
+    request.write(sharedata)
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
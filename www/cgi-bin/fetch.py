@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
-import lzma
-import MySQLdb
+import itertools
+import json
+import math
 import MySQLdb.cursors as cursors
+import operator
 import struct
 import sys
 
@@ -12,8 +12,20 @@ try:
 except ImportError:
     ENABLE_COMPRESSION = True
 
+try:
+    from config import FETCH_ROWS
+except ImportError:
+    FETCH_ROWS = 65536
+
 from auth import protect_dataset
-from db import HOST, USER, PASSWORD, DB
+from codec import COMPRESSORS, negotiate
+from endpoint import run_cgi
+from metadata import load_schema
+from rollup import select_resolution
+from validity import get_validity_key, load_valid_map
+
+FIRST_FETCH_ROWS = 1000
+'''The number of rows of the first batch fetched from the database.'''
 
 FROM_SQL_TYPE = {
     'BOOLEAN': ('u8', 'B'),
@@ -28,86 +40,336 @@ FROM_SQL_TYPE = {
     'DOUBLE': ('double', 'd'),
 }
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.flush()
+def pack_block(rows, columns):
+    '''Pack rows into one block of the batch (columnar) encoding.
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
-key = args['key'].value if 'key' in args else ''
-rate = float(args['rate'].value) if 'rate' in args else None
-start = float(args['start'].value) if 'start' in args else None
-end = float(args['end'].value) if 'end' in args else None
+       A block is made of the number of rows (u32), the timestamps, then for
+       each column a validity bitmap (LSB first, 1 for non-NULL values) and the
+       values (NULL values are packed as 0).
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB, cursorclass=cursors.SSCursor)
-try:
-    cursor = db.cursor()
+       Args:
+           rows (list): The rows, the timestamp first then one value per column.
+           columns (list): A list of (key, type, struct_type) tuples.
+
+       Returns:
+           The packed block (bytearray).
+    '''
+    count = len(rows)
+    raw = bytearray(struct.pack('<I', count))
+    raw += struct.pack(f'<{count}d', *[row[0] for row in rows])
+    for index, (_, _, struct_type) in enumerate(columns, start=1):
+        values = [row[index] for row in rows]
+        bitmap = bytearray((count + 7) // 8)
+        for i, value in enumerate(values):
+            if value is not None:
+                bitmap[i >> 3] |= 1 << (i & 7)
+        raw += bitmap
+        raw += struct.pack(f'<{count}{struct_type}',
+                           *[0 if value is None else value for value in values])
+    return raw
+
+INTEGER_WIDTHS = [(1, 'b'), (2, 'h'), (4, 'l'), (8, 'q')]
+
+def pack_integers(values):
+    '''Pack signed integers with the smallest width fitting all of them.
+
+       Integers overflowing 64 bits are wrapped around.
+
+       Args:
+           values (list (int)): The integers.
+
+       Returns:
+           The width in bytes (u8) followed by the integers (bytes).
+    '''
+    lo = min(values, default=0)
+    hi = max(values, default=0)
+    if lo < -(1 << 63) or hi >= 1 << 63:
+        values = [(value + (1 << 63)) % (1 << 64) - (1 << 63) for value in values]
+        lo, hi = min(values), max(values)
+    for width, struct_type in INTEGER_WIDTHS:
+        limit = 1 << (8 * width - 1)
+        if -limit <= lo and hi < limit:
+            break
+    return struct.pack('<B', width) + struct.pack(f'<{len(values)}{struct_type}', *values)
+
+def pack_block_delta(rows, columns):
+    '''Pack rows into one block of the delta (version 2) encoding.
+
+       A block is made of the number of rows (u32), the timestamps, then for
+       each column a validity bitmap (as in pack_block()) and the values.
+
+       The timestamps are the first timestamp (f64), followed by the
+       delta-of-delta of the next ones, computed on their IEEE 754 bit
+       patterns (see pack_integers()). This is lossless, and nearly all zeros
+       for regularly sampled data.
+
+       The integer values are the first value (s64), followed by the delta of
+       the next ones (see pack_integers()). The floating-point values are the
+       XOR of the bit patterns of each value with the previous one (as in
+       Gorilla), with their bytes transposed so that the (mostly zero) high
+       and low bytes are grouped for the compression.
+
+       Args:
+           rows (list): The rows, the timestamp first then one value per column.
+           columns (list): A list of (key, type, struct_type) tuples.
+
+       Returns:
+           The packed block (bytearray).
+    '''
+    count = len(rows)
+    raw = bytearray(struct.pack('<I', count))
+    if count == 0:
+        return raw
+
+    bits = struct.unpack(f'<{count}q', struct.pack(f'<{count}d', *[row[0] for row in rows]))
+    deltas = list(map(operator.sub, bits[1:], bits[:-1]))
+    raw += struct.pack('<q', bits[0])
+    raw += pack_integers(deltas[:1] + list(map(operator.sub, deltas[1:], deltas[:-1])))
+
+    for index, (_, _, struct_type) in enumerate(columns, start=1):
+        values = [row[index] for row in rows]
+        bitmap = bytearray((count + 7) // 8)
+        for i, value in enumerate(values):
+            if value is not None:
+                bitmap[i >> 3] |= 1 << (i & 7)
+        raw += bitmap
+
+        values = [0 if value is None else value for value in values]
+        if struct_type in 'fd':
+            size = struct.calcsize(struct_type)
+            unsigned_type = 'L' if size == 4 else 'Q'
+            bits = struct.unpack(f'<{count}{unsigned_type}',
+                                 struct.pack(f'<{count}{struct_type}', *values))
+            xors = struct.pack(f'<{count}{unsigned_type}', bits[0],
+                               *map(operator.xor, bits[1:], bits[:-1]))
+            raw += b''.join([xors[i::size] for i in range(size)])
+        else:
+            # u64 values are sent as their s64 bit pattern.
+            first = values[0] - (1 << 64) if values[0] >= 1 << 63 else values[0]
+            raw += struct.pack('<q', first)
+            raw += pack_integers(list(map(operator.sub, values[1:], values[:-1])))
+    return raw
+
+def thin_rows(rows, rate, last_t):
+    '''Keep the rows that are at least some time apart.
+
+       Args:
+           rows (list): The rows, the timestamp first.
+           rate (float): The minimum time between two rows kept.
+           last_t (float): The timestamp of the last row kept so far.
+
+       Returns:
+           The rows kept (list), and the timestamp of the last row kept.
+    '''
+    kept = list()
+    for row in rows:
+        if row[0] - last_t >= rate:
+            kept.append(row)
+            last_t = row[0]
+    return kept, last_t
+
+def handle(request):
+    args = request.args
+    dataset = int(args['d'].value)
+    keys = args.getlist('key')
+    rate = float(args['rate'].value) if 'rate' in args else None
+    start = float(args['start'].value) if 'start' in args else None
+    end = float(args['end'].value) if 'end' in args else None
+    since = float(args['since'].value) if 'since' in args else None
+    points = int(args['points'].value) if 'points' in args else None
+    encoding = int(args['encoding'].value) if 'encoding' in args else 1
+    filtered = 'filter' in args and args['filter'].value == '1'
+    valid = [float(value) for value in args.getlist('valid')] or [0]
+
+    if points is not None and points < 1:
+        request.start([('Content-Type', 'text/plain')], status='400 Bad Request')
+        request.write('The number of points must be at least 1\n')
+        return
+
+    # Stream the rows from the server, rather than loading them in memory.
+    cursor = request.db.cursor(cursors.SSCursor)
 
     protect_dataset(cursor, dataset)
 
-    pack_t = struct.Struct('<d')
+    # Only datasets that are not recording can be cached by the client: their
+    # data only changes when trimmed, which bumps the "Last Updated" time.
+    query = f'SELECT UNIX_TIMESTAMP(`updated`), `port` FROM `datasets` WHERE `id` = {dataset};'
+    cursor.execute(query)
+    row = cursor.fetchone()
+    etag = f'"{dataset}-{row[0]}"' if row[0] is not None and row[1] is None else None
+
+    if etag is not None and request.environ.get('HTTP_IF_NONE_MATCH', '') == etag:
+        request.start([('ETag', etag)], status='304 Not Modified')
+        return
+
+    # The client lists the codecs it can decode, in order of preference.
+    codec = negotiate(request.environ.get('HTTP_X_POSTAL_CODECS'), ENABLE_COMPRESSION)
+
+    headers = [
+        ('Content-Type', 'application/octet-stream'),
+        ('X-Postal-Codec', codec),
+    ]
+    if etag is not None:
+        headers.append(('ETag', etag))
+    request.start(headers)
+
+    query_args = None
 
     interval = ''
     if start is not None:
         interval += f' AND `t` >= {start}'
     if end is not None:
         interval += f' AND `t` < {end}'
+    if since is not None:
+        # Only the rows appended after the last one fetched (live datasets).
+        interval += f' AND `t` > {since}'
+
+    # In filtering mode, values are only returned when their validity key is
+    # among the valid values (and they are NULL otherwise).
+    validity_keys = dict()
+    if filtered and keys:
+        valid_map = load_valid_map(cursor, dataset)
+        for key in keys:
+            validity_key = get_validity_key(valid_map, key)
+            if validity_key is not None:
+                validity_keys[key] = validity_key
+
+    if keys:
+        # Look up the types of all the requested columns. This also rejects
+        # any key that is not an existing column.
+        schema = load_schema(cursor, dataset)
+        types = dict()
+        for key in keys + list(validity_keys.values()):
+            if key in schema:
+                types[key] = FROM_SQL_TYPE[schema[key]]
+        columns = [(key, *types[key]) for key in keys]
 
-    if key != '':
-        query = 'SELECT `data_type`, `column_type` FROM INFORMATION_SCHEMA.COLUMNS WHERE ' + \
-                '`table_name` = %s AND `column_name` = %s;'
-        cursor.execute(query, (f'dataset_{dataset}', key))
-        row = cursor.fetchone()
-        sql_type = row[0] + (' unsigned' if row[1].endswith('unsigned') else '')
-        type, struct_type = FROM_SQL_TYPE[sql_type.upper()]
+    def value_of(key):
+        validity_key = validity_keys.get(key)
+        if validity_key is None:
+            return f'`{key}`'
+        elif validity_key not in types:
+            # Without a validity key, no value is valid.
+            return 'NULL'
+        valid_values = ', '.join([repr(value) for value in valid])
+        return f'IF(`{validity_key}` IN ({valid_values}), `{key}`, NULL)'
+
+    downsample = len(keys) == 1 and points is not None
+    if downsample:
+        key, type, struct_type = columns[0]
         string_type = '{}\n'.format(type).encode('ascii')
 
-        pack_value = struct.Struct('<' + struct_type)
+        # Downsampling mode (M4): the interval is split into (up to) "points"
+        # buckets, and one record is returned per non-empty bucket with the
+        # first and last timestamps, the first, last, minimum and maximum
+        # values, then the mean value and the count of values.
+        pack_value = struct.Struct('<dd{0}{0}{0}{0}dQ'.format(struct_type))
+        to_value = float if struct_type in 'fd' else int
+
+        if start is None or end is None:
+            cursor.execute(f'SELECT MIN(`t`), MAX(`t`) FROM `dataset_{dataset}`;')
+            row = cursor.fetchone()
+            start = row[0] if start is None else start
+            end = row[1] if end is None else end
+        width = max((end - start) / points, sys.float_info.min) if start is not None else 1
+
+        origin = start if start is not None else 0
 
-        # TODO: Possible SQL injection through use of "key".
-        query = 'SELECT `t`, `{0}` FROM `dataset_{1}` WHERE `{0}` IS NOT NULL {2};'.format(
-            key, dataset, interval)
+        # Use the coarsest rollup that is fine enough, if any. Buckets of the
+        # rollup straddling the interval bounds are included in full.
+        res = select_resolution(width)
+        if key in validity_keys:
+            # The rollups are not filtered.
+            res = None
+        if res is not None:
+            cursor.execute('SHOW TABLES LIKE %s;', (f'rollup_{dataset}',))
+            if cursor.fetchone() is None:
+                res = None
+
+        if res is not None:
+            rollup_interval = ''
+            if start is not None:
+                rollup_interval += f' AND `b` >= {math.floor(start / res) * res}'
+            if end is not None:
+                rollup_interval += f' AND `b` < {end}'
+            buckets = 'SELECT MIN(`tf`) AS `tf`, MAX(`tl`) AS `tl`, MIN(`vmin`) AS `vmin`, ' + \
+                      'MAX(`vmax`) AS `vmax`, SUM(`vsum`) / SUM(`n`) AS `vmean`, SUM(`n`) AS `n` ' + \
+                      f'FROM `rollup_{dataset}` WHERE `k` = %s AND `res` = {res} {rollup_interval} ' + \
+                      f'GROUP BY FLOOR((`b` - {origin}) / {width})'
+            query_args = (key,)
+        else:
+            buckets = f'SELECT MIN(`t`) AS `tf`, MAX(`t`) AS `tl`, MIN(`{key}`) AS `vmin`, ' + \
+                      f'MAX(`{key}`) AS `vmax`, AVG(`{key}`) AS `vmean`, COUNT(*) AS `n` ' + \
+                      f'FROM `dataset_{dataset}` WHERE {value_of(key)} IS NOT NULL {interval} ' + \
+                      f'GROUP BY FLOOR((`t` - {origin}) / {width})'
+
+        # The first and last values are looked up by primary key, once per
+        # bucket.
+        query = 'SELECT `a`.`tf`, `a`.`tl`, `f`.`{0}`, `l`.`{0}`, ' + \
+                '`a`.`vmin`, `a`.`vmax`, `a`.`vmean`, `a`.`n` FROM ({2}) AS `a` ' + \
+                'JOIN `dataset_{1}` AS `f` ON `f`.`t` = `a`.`tf` ' + \
+                'JOIN `dataset_{1}` AS `l` ON `l`.`t` = `a`.`tl` ORDER BY `a`.`tf`;'
+        query = query.format(key, dataset, buckets)
+    elif len(keys) == 1 and encoding == 1:
+        key, type, struct_type = columns[0]
+        string_type = '{}\n'.format(type).encode('ascii')
+
+        value = value_of(key)
+        query = f'SELECT `t`, {value} FROM `dataset_{dataset}` WHERE {value} IS NOT NULL {interval};'
+    elif keys:
+        # Batch mode: a JSON header describing the columns, followed by blocks
+        # of rows (see pack_block(), or pack_block_delta() for the version 2
+        # encoding, also used for a single key).
+        header = {
+            'columns': [{'key': key, 'type': type} for key, type, _ in columns],
+        }
+        if encoding == 2:
+            header['encoding'] = 2
+        string_type = (json.dumps(header) + '\n').encode('utf-8')
+
+        selected = ', '.join([value_of(key) for key in keys])
+        not_null = ' OR '.join([f'{value_of(key)} IS NOT NULL' for key in keys])
+        query = f'SELECT `t`, {selected} FROM `dataset_{dataset}` WHERE ({not_null}) {interval};'
     else:
         query = f'SELECT `t` FROM `dataset_{dataset}`;'
         string_type = None
 
-    if ENABLE_COMPRESSION:
-        compressor = lzma.LZMACompressor(format=lzma.FORMAT_ALONE)
-        if string_type:
-            sys.stdout.buffer.write(compressor.compress(string_type))
-    else:
-        if string_type:
-            sys.stdout.buffer.write(string_type)
+    compressor = COMPRESSORS[codec]()
+    if string_type:
+        request.write(compressor.compress(string_type))
 
-    cursor.execute(query)
+    cursor.execute(query, query_args)
 
+    # The first batches of rows are small, so that the client receives data
+    # early, and the next ones grow up to FETCH_ROWS, which is cheaper.
+    fetch_rows = FIRST_FETCH_ROWS
     last_t = 0
     while True:
-        rows = cursor.fetchmany(size=1000)
+        rows = cursor.fetchmany(size=fetch_rows)
         if not rows:
             break
+        fetch_rows = min(fetch_rows * 4, FETCH_ROWS)
 
-        raw = bytes()
-        for row in rows:
-            t = row[0]
-
-            if rate is not None and t - last_t < rate:
-                continue
+        if rate is not None and not downsample:
+            rows, last_t = thin_rows(rows, rate, last_t)
 
-            raw += pack_t.pack(t)
-            if key != '':
-                raw += pack_value.pack(row[1])
-
-            last_t = t
-
-        if ENABLE_COMPRESSION:
-            sys.stdout.buffer.write(compressor.compress(raw))
+        if downsample:
+            raw = b''.join([pack_value.pack(*row[:4], to_value(row[4]), to_value(row[5]),
+                                            float(row[6]), int(row[7])) for row in rows])
+        elif len(keys) > 1 or (keys and encoding == 2):
+            pack = pack_block_delta if encoding == 2 else pack_block
+            raw = pack(rows, columns) if rows else bytes()
+        elif keys:
+            # The timestamps and values, interleaved, in one call.
+            raw = struct.pack('<' + ('d' + struct_type) * len(rows),
+                              *itertools.chain.from_iterable(rows))
         else:
-            sys.stdout.buffer.write(raw)
+            raw = struct.pack(f'<{len(rows)}d', *[row[0] for row in rows])
+
+        # Send the batch right away (if the codec allows).
+        request.write(compressor.compress(raw) + compressor.sync())
 
-    if ENABLE_COMPRESSION:
-        sys.stdout.buffer.write(compressor.flush())
+    request.write(compressor.flush())
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
-import cgitb
-import sys
-
 from auth import get_username
+from endpoint import run_cgi
+
+def handle(request):
+    request.start([('Content-Type', 'application/octet-stream')])
+    request.write(get_username())
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.write(get_username())
-sys.stdout.flush()
+if __name__ == '__main__':
+    run_cgi(handle)
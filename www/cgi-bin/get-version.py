@@ -1,30 +1,41 @@
 #!/usr/bin/env python3
-import cgitb
+import functools
+import os
 import subprocess
-import sys
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.flush()
+from endpoint import run_cgi
 
-try:
+# The repository (also the working directory of CGI scripts).
+path = os.path.dirname(os.path.abspath(__file__))
+
+@functools.lru_cache(maxsize=None)
+def get_version():
+    '''Get the version of the server, once per process.
+
+       Returns:
+           The branch and commit (str), marked as dirty with local changes.
+    '''
     stdout = subprocess.check_output('git rev-parse --abbrev-ref HEAD',
-                                     shell=True,
+                                     shell=True, cwd=path,
                                      stderr=subprocess.STDOUT)
     branch = stdout.decode().strip()
 
     stdout = subprocess.check_output('git rev-parse HEAD',
-                                     shell=True,
+                                     shell=True, cwd=path,
                                      stderr=subprocess.STDOUT)
     sha1 = stdout.decode().strip()[:8]
 
     stdout = subprocess.check_output('git status --untracked-files=no --porcelain',
-                                     shell=True,
+                                     shell=True, cwd=path,
                                      stderr=subprocess.STDOUT)
     if len(stdout.decode().strip()) > 0:
         sha1 += '-dirty'
 
-    sys.stdout.write('{}@{}'.format(branch, sha1))
+    return '{}@{}'.format(branch, sha1)
+
+def handle(request):
+    request.start([('Content-Type', 'application/octet-stream')])
+    request.write(get_version())
 
-finally:
-    sys.stdout.flush()
+if __name__ == '__main__':
+    run_cgi(handle)
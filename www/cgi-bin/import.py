@@ -1,23 +1,37 @@
 #!/usr/bin/env python3
 import argparse
+import collections
 import json
 import math
 import select
 import socket
 import sys
 import syslog
+import time
 import traceback
 import uuid
 
 import MySQLdb
 
 from db import HOST, USER, PASSWORD, DB
+from live import Publisher
+from metadata import load_metadata, load_schema
+from rollup import create_rollup_table, update_rollups
 
 SELECT_READONLY = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
 '''Helper definition to program select() for read events.'''
 
 INACTIVITY_TIMEOUT = 15 * 60 * 1000
-'''The inactivity timeout before terminating the importer, in seconds.'''
+'''The inactivity timeout before terminating the importer, in milliseconds.'''
+
+RECV_SIZE = 256 * 1024
+'''The size of the reads from the socket, in bytes.'''
+
+BATCH_ROWS = 1000
+'''The maximum number of rows inserted in a single request.'''
+
+BATCH_INTERVAL = 1000
+'''The maximum time rows are held before being inserted, in milliseconds.'''
 
 TO_PYTHON_TYPE = {
     'BOOLEAN': lambda x: int(float(x)),
@@ -39,25 +53,57 @@ class Importer:
 
            Args:
                dataset_id (int): The dataset unique identifier.
-               db (MySQLConnection): The database to import the data into.
+               db (MySQLConnection): The database to import the data into, or
+                                     None to bind one later (see bind()).
                use_syslog (bool): Whether to use syslog instead of stdout/err for logging.
         '''
         self._dataset_id = dataset_id
-        self._db = db
         self._use_syslog = use_syslog
 
         # Objects for network I/O.
         self._poller = None
         self._accept_sock = None
         self._recv_sock = None
+        self._recv_buffer = b''
+        self._recv_lines = collections.deque()
 
         # Objects for database access.
         self._annotations = dict()
-        self._cursor = db.cursor()
+        self._db = None
+        self._cursor = None
+        if db is not None:
+            self.bind(db)
+
+        # State of the CSV stream.
+        self._header_line = None
+        self._header = None
+        self._data_columns = None
+        self._data_types = None
+        self._last_raw_data_values = None
+
+        # Rows and annotations waiting to be inserted.
+        self._pending_rows = list()
+        self._pending_annotations = list()
+        self._pending_deadline = None
+
+        # The rows inserted are published to the live streams (see live.py).
+        self._publisher = Publisher(dataset_id)
 
         # Statistics.
         self.total_frames = 0
 
+    def bind(self, db):
+        '''Use a (different) database connection for subsequent accesses.
+
+           Args:
+               db (MySQLConnection): The database to import the data into.
+
+           Returns:
+               Nothing.
+        '''
+        self._db = db
+        self._cursor = db.cursor()
+
     def _auto_annotate_frame(self, ts, data_columns, last_data_values, data_values):
         '''Generate auto-annotations based on common events.
 
@@ -87,10 +133,8 @@ class Importer:
             uid = uuid.uuid4().hex
             self._annotations[ts] = uid
 
-            query = f'INSERT INTO `annotation_{self._dataset_id}`(`id`, `t`, `text`) ' + \
-                    f'VALUES(%s, {ts}, %s);'
-            self._cursor.execute(query, (uid, label))
-            self._db.commit()
+            # Inserted along with the current batch of rows.
+            self._pending_annotations.append((uid, ts, label))
 
         # TODO: Add auto-annotation code here!
         for i in range(len(data_columns)):
@@ -128,10 +172,30 @@ class Importer:
             'testValid': 'testValidFlag',
         }
 
+        # Record the schema, so that the endpoints do not query the (slow)
+        # catalog of the database.
+        metadata['schema'] = [[column, data_type] for column, data_type in
+                              zip(self._data_columns, self._data_types)]
+
         # Now store the metadata.
         insert_into = f'INSERT INTO metadata(`id`, `metadata`) VALUES({self._dataset_id}, %s);'
         self._cursor.execute(insert_into, (json.dumps(metadata),))
 
+    def _store_schema(self):
+        '''Record the schema in the metadata of a dataset that predates it.
+
+           Returns:
+               Nothing.
+        '''
+        metadata = load_metadata(self._cursor, self._dataset_id)
+        if not metadata or 'schema' in metadata:
+            return
+
+        metadata = dict(metadata)
+        metadata['schema'] = list(load_schema(self._cursor, self._dataset_id).items())
+        update = f'UPDATE `metadata` SET `metadata` = %s WHERE `id` = {self._dataset_id};'
+        self._cursor.execute(update, (json.dumps(metadata),))
+
     def finalize(self):
         '''Finalize the importer object before destruction.
 
@@ -141,16 +205,31 @@ class Importer:
         # Clear out the port number before exiting.
         update = f'UPDATE `datasets` SET `port` = NULL WHERE `id` = {self._dataset_id};'
         self._cursor.execute(update)
+        self.close()
+
+    def close(self):
+        '''Close the connection to the live update daemon, if any.
 
-    def _get_next_input_line(self):
+           Returns:
+               Nothing.
+        '''
+        self._publisher.close()
+
+    def _get_next_input_line(self, timeout=INACTIVITY_TIMEOUT):
         '''Wait for the input line.
 
+           Args:
+               timeout (int): How long to wait for data, in milliseconds.
+
            Returns:
                One full line worth of data, or None if there is no more data to return.
         '''
-        buffer = ''
         while True:
-            available = self._poller.poll(INACTIVITY_TIMEOUT)
+            # Serve the lines already received first.
+            if self._recv_lines:
+                return self._recv_lines.popleft().decode('ascii')
+
+            available = self._poller.poll(timeout)
             if not available:
                 # Reached the timeout.
                 return None
@@ -166,60 +245,49 @@ class Importer:
                 self._poller.unregister(self._accept_sock)
                 continue
 
-            # Read 1 byte.
-            # NOTE: This sample importer is not optimized. A better
-            # implementation would use buffering.
-            c = self._recv_sock.recv(1).decode('ascii')
+            data = self._recv_sock.recv(RECV_SIZE)
 
             # Detect disconnection.
-            if c == '':
+            if not data:
                 self._poller.unregister(self._recv_sock)
                 self._poller.register(self._accept_sock, SELECT_READONLY)
                 self._recv_sock.close()
                 self._recv_sock = None
                 if self._use_syslog:
                     syslog.syslog('Connection closed')
-                buffer = ''
+                self._recv_buffer = b''
+                continue
 
-            # Process input characters.
-            elif c == '\n':
-                return buffer
-            else:
-                buffer += c
+            # Split into lines, keeping any incomplete line for later.
+            lines = (self._recv_buffer + data).split(b'\n')
+            self._recv_buffer = lines.pop()
+            self._recv_lines.extend(lines)
 
-    def import_data(self):
-        '''Import data into the Postal.
+    def start(self, header_line):
+        '''Process the header line of the CSV, and create the tables if needed.
+
+           Args:
+               header_line (str): The header line.
 
            Returns:
                Nothing.
         '''
-        # Open our server socket first.
-        self._accept_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._accept_sock.bind(('0.0.0.0', 0))
-        _, port = self._accept_sock.getsockname()
-        self._accept_sock.listen(1)
-        print(f'Listening on port {port}')
-        self._poller = select.poll()
-        self._poller.register(self._accept_sock, SELECT_READONLY)
-
-        update = f'UPDATE `datasets` SET `port` = {port} WHERE `id` = {self._dataset_id};'
-        self._cursor.execute(update)
-        self._db.commit()
-
         # Identify columns in the CSV.
-        header_line = self._get_next_input_line()
-        header = header_line.split(',')
+        self._header_line = header_line
+        self._header = header_line.split(',')
         data_columns = list()
         data_types = list()
 
         # Assume the first column is always time.
-        for column in header[1:]:
+        for column in self._header[1:]:
             head = column.split(':')
             data_columns.append(head[0])
             if len(head) > 1 and head[1] in TO_PYTHON_TYPE:
                 data_types.append(head[1])
             else:
                 data_types.append('DOUBLE')
+        self._data_columns = data_columns
+        self._data_types = data_types
 
         # Check whether the tables already exists or need to be created. We
         # assume that if the dataset_ table exists, all tables exist.
@@ -232,81 +300,202 @@ class Importer:
                        zip(data_columns, data_types)]
             columns = ', '.join(['`t` DOUBLE PRIMARY KEY'] + columns)
             create_table = f'CREATE TABLE `annotation_{self._dataset_id}`(' + \
-                           '`id` VARCHAR(32) NOT NULL, `t` DOUBLE, `text` TEXT, PRIMARY KEY (`id`));'
+                           '`id` VARCHAR(32) NOT NULL, `t` DOUBLE, `text` TEXT, PRIMARY KEY (`id`), ' + \
+                           'INDEX `t` (`t`, `id`));'
             create_table += f'CREATE TABLE `dataset_{self._dataset_id}`({columns});'
             self._cursor.execute(create_table)
 
             # # Generate and store the metadata.
             self._store_metadata()
+        else:
+            self._store_schema()
+
+        # Index the annotations by time, for existing datasets that predate the
+        # index.
+        self._cursor.execute(f'SHOW INDEX FROM `annotation_{self._dataset_id}` ' +
+                             "WHERE `Key_name` = 't';")
+        if self._cursor.fetchone() is None:
+            self._cursor.execute(f'ALTER TABLE `annotation_{self._dataset_id}` ' +
+                                 'ADD INDEX `t` (`t`, `id`);')
+
+        # Create the rollups, and compute them for existing datasets that
+        # predate them.
+        if create_rollup_table(self._cursor, self._dataset_id):
+            self._cursor.execute(f'SELECT MIN(`t`), MAX(`t`) FROM `dataset_{self._dataset_id}`;')
+            t_min, t_max = self._cursor.fetchone()
+            if t_min is not None:
+                update_rollups(self._cursor, self._dataset_id, data_columns, t_min, t_max)
+        self._db.commit()
 
-        last_raw_data_values = None
-        while True:
-            line = self._get_next_input_line()
-            if line is None:
-                if self._use_syslog:
-                    syslog.syslog('Ending due to inactivity')
-                else:
-                    print('Ending due to inactivity')
-                    break
-            elif line == header_line:
-                # Ignore a repeated header line.
-                continue
+    def process_line(self, line):
+        '''Parse one line of the CSV, and queue the row for insertion.
+
+           This method does not access the database, see flush().
 
-            values = line.split(',')
-
-            # Convert the timestamp to UTC.
-            from datetime import datetime, timezone
-            ts = datetime.strptime(values[0], '%b %d %Y').replace(
-                tzinfo=timezone.utc).timestamp()
-            data = dict()
-            for i in range(1, len(header)):
-                data[header[i]] = values[i]
-
-            # Convert to the correct type to enable derivations.
-            for index in range(len(data_columns)):
-                key = data_columns[index]
-                data_type = data_types[index]
-                value = data.get(key, '')
-                if value != '':
-                    data[key] = TO_PYTHON_TYPE[data_type](value)
-                else:
-                    data[key] = None
-
-            # Dump values.
-            raw_data_values = list()
-            data_values = list()
-            for key in data_columns:
-                value = data.get(key, None)
-                if isinstance(value, float) and math.isnan(value):
+           Args:
+               line (str): The line, without the line terminator.
+
+           Returns:
+               Nothing.
+        '''
+        if line == self._header_line:
+            # Ignore a repeated header line.
+            return
+
+        header = self._header
+        data_columns = self._data_columns
+        data_types = self._data_types
+
+        values = line.split(',')
+
+        # Convert the timestamp to UTC.
+        from datetime import datetime, timezone
+        ts = datetime.strptime(values[0], '%b %d %Y').replace(
+            tzinfo=timezone.utc).timestamp()
+        data = dict()
+        for i in range(1, len(header)):
+            data[header[i]] = values[i]
+
+        # Convert to the correct type to enable derivations.
+        for index in range(len(data_columns)):
+            key = data_columns[index]
+            data_type = data_types[index]
+            value = data.get(key, '')
+            if value != '':
+                data[key] = TO_PYTHON_TYPE[data_type](value)
+            else:
+                data[key] = None
+
+        # Dump values.
+        raw_data_values = list()
+        data_values = list()
+        for key in data_columns:
+            value = data.get(key, None)
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            if isinstance(value, str):
+                if value.startswith('0x'):
+                    value = int(value, 16)
+                elif value == '':
                     value = None
-                if isinstance(value, str):
-                    if value.startswith('0x'):
-                        value = int(value, 16)
-                    elif value == '':
-                        value = None
-                raw_data_values.append(value)
-                if value is not None:
-                    data_values.append(str(value))
-                else:
-                    data_values.append('NULL')
-
-            # NOTE: This sample importer is not optimized. A better implementation
-            # would bundle several rows into a single request.
-            insert_into = 'INSERT IGNORE INTO `dataset_{}` VALUES({})'.format(
-                self._dataset_id, ', '.join([str(ts)] + data_values))
-            self._cursor.execute(insert_into)
-
-            # Update the "Last Updated" time for bookkeeping.
-            # NOTE: Same comment as above.
-            update = f'UPDATE `datasets` SET `updated` = NOW() WHERE `id` = {self._dataset_id};'
-            self._cursor.execute(update)
-            self._db.commit()
-
-            # Generate auto-annotations.
-            self._auto_annotate_frame(ts, data_columns, last_raw_data_values, raw_data_values)
-            last_raw_data_values = raw_data_values
-
-            self.total_frames += 1
+            raw_data_values.append(value)
+            if value is not None:
+                data_values.append(str(value))
+            else:
+                data_values.append('NULL')
+
+        # Queue the row for the next batch.
+        if not self._pending_rows:
+            self._pending_deadline = time.monotonic() + BATCH_INTERVAL / 1000
+        self._pending_rows.append((ts, data_values, raw_data_values))
+
+        # Generate auto-annotations.
+        self._auto_annotate_frame(ts, data_columns, self._last_raw_data_values, raw_data_values)
+        self._last_raw_data_values = raw_data_values
+
+        self.total_frames += 1
+
+    def flush_timeout(self):
+        '''Get the time left before the pending rows must be inserted.
+
+           Returns:
+               The time left in milliseconds, or None if there are no pending rows.
+        '''
+        if not self._pending_rows:
+            return None
+        return max(0, int((self._pending_deadline - time.monotonic()) * 1000))
+
+    def needs_flush(self):
+        '''Check whether the pending rows must be inserted now.
+
+           Returns:
+               True if the batch is full or too old.
+        '''
+        return bool(self._pending_rows) and (len(self._pending_rows) >= BATCH_ROWS or
+                                             self.flush_timeout() == 0)
+
+    def flush(self):
+        '''Insert the pending rows and annotations into the dataset, and commit.
+
+           Returns:
+               Nothing.
+        '''
+        if not self._pending_rows:
+            return
+
+        rows = self._pending_rows
+        insert_into = 'INSERT IGNORE INTO `dataset_{}` VALUES {}'.format(
+            self._dataset_id, ', '.join(['({})'.format(', '.join([str(ts)] + data_values))
+                                         for ts, data_values, _ in rows]))
+        self._cursor.execute(insert_into)
+        inserted = self._cursor.rowcount
+
+        for uid, ts, label in self._pending_annotations:
+            query = f'INSERT INTO `annotation_{self._dataset_id}`(`id`, `t`, `text`) ' + \
+                    f'VALUES(%s, {ts}, %s);'
+            self._cursor.execute(query, (uid, label))
+
+        # Update the rollups.
+        timestamps = [ts for ts, _, _ in rows]
+        update_rollups(self._cursor, self._dataset_id, self._data_columns,
+                       min(timestamps), max(timestamps))
+
+        # Update the "Last Updated" time for bookkeeping.
+        update = f'UPDATE `datasets` SET `updated` = NOW() WHERE `id` = {self._dataset_id};'
+        self._cursor.execute(update)
+        self._db.commit()
+
+        # Only the rows committed are published. The rows ignored as duplicate
+        # timestamps (such as a file sent again) are not known, so a batch with
+        # any of them is not published at all.
+        if inserted == len(rows):
+            self._publisher.publish(self._data_columns,
+                                    [[ts] + raw_data_values for ts, _, raw_data_values in rows])
+
+        self._pending_rows = list()
+        self._pending_annotations = list()
+
+    def import_data(self):
+        '''Import data into the Postal.
+
+           Returns:
+               Nothing.
+        '''
+        # Open our server socket first.
+        self._accept_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._accept_sock.bind(('0.0.0.0', 0))
+        _, port = self._accept_sock.getsockname()
+        self._accept_sock.listen(1)
+        print(f'Listening on port {port}')
+        self._poller = select.poll()
+        self._poller.register(self._accept_sock, SELECT_READONLY)
+
+        update = f'UPDATE `datasets` SET `port` = {port} WHERE `id` = {self._dataset_id};'
+        self._cursor.execute(update)
+        self._db.commit()
+
+        self.start(self._get_next_input_line())
+
+        try:
+            while True:
+                # Insert the pending rows when the batch is full or too old.
+                if self.needs_flush():
+                    self.flush()
+
+                timeout = self.flush_timeout()
+                line = self._get_next_input_line(
+                    timeout if timeout is not None else INACTIVITY_TIMEOUT)
+                if line is not None:
+                    self.process_line(line)
+                elif timeout is None:
+                    if self._use_syslog:
+                        syslog.syslog('Ending due to inactivity')
+                    else:
+                        print('Ending due to inactivity')
+                    break
+        finally:
+            # Do not lose the rows received so far.
+            self.flush()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
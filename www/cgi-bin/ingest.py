@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+'''
+A long-running daemon importing data into many datasets over a single port.
+
+Each uploader connection starts with a handshake line selecting the dataset
+("dataset <id>"), followed by the CSV data as accepted by import.py. The
+database accesses of all the connections are served by a shared pool of
+connections.
+'''
+import argparse
+import asyncio
+import concurrent.futures
+import importlib
+import os
+import queue
+import sys
+import syslog
+import time
+import traceback
+
+import MySQLdb
+
+try:
+    from config import INGEST_PORT
+except ImportError:
+    INGEST_PORT = None
+
+from db import HOST, USER, PASSWORD, DB
+
+Importer = importlib.import_module('import').Importer
+INACTIVITY_TIMEOUT = importlib.import_module('import').INACTIVITY_TIMEOUT
+
+POOL_SIZE = 8
+'''The number of connections to the database.'''
+
+HANDSHAKE_TIMEOUT = 30
+'''The time allowed to send the handshake line after connecting, in seconds.'''
+
+LINE_LIMIT = 1024 * 1024
+'''The maximum length of a line of CSV, in bytes.'''
+
+REAPER_INTERVAL = 60
+'''The interval between checks for inactive datasets, in seconds.'''
+
+class IngestServer:
+    def __init__(self, port, pool_size=POOL_SIZE):
+        '''Constructor.
+
+           Args:
+               port (int): The TCP port to listen on.
+               pool_size (int): The number of connections to the database.
+        '''
+        self._port = port
+
+        # The database connections, and the threads using them. There are as
+        # many threads as connections, so that a thread never waits for a
+        # connection.
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(MySQLdb.connect(HOST, USER, PASSWORD, DB))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+
+        # Serialize the creation of the tables and the inserts for each
+        # dataset, as the rollups of concurrent inserts overlap.
+        self._dataset_locks = dict()
+
+        # Bookkeeping of the datasets for the inactivity timeout, owned by the
+        # event loop. No connection starts while inactive datasets are being
+        # stopped (see _reap()).
+        self._connections = dict()
+        self._last_activity = dict()
+        self._not_reaping = asyncio.Event()
+        self._not_reaping.set()
+
+        # Set by start().
+        self._server = None
+        self._reaper_task = None
+
+    def _log(self, message):
+        syslog.syslog(message)
+
+    def _with_connection(self, function, *args):
+        '''Call a function with a connection from the pool (in a worker thread).
+
+           Args:
+               function (callable): The function, taking the connection first.
+               args: The other arguments to the function.
+
+           Returns:
+               The return value of the function.
+        '''
+        db = self._pool.get()
+        try:
+            try:
+                db.ping()
+            except MySQLdb.OperationalError:
+                db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
+            return function(db, *args)
+        finally:
+            self._pool.put(db)
+
+    async def _run_db(self, function, *args):
+        '''Call a function with a connection from the pool, without blocking.
+
+           Args:
+               function (callable): The function, taking the connection first.
+               args: The other arguments to the function.
+
+           Returns:
+               The return value of the function.
+        '''
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._with_connection,
+                                          function, *args)
+
+    @staticmethod
+    def _is_recording(db, dataset_id):
+        cursor = db.cursor()
+        cursor.execute(f'SELECT `port` FROM `datasets` WHERE `id` = {dataset_id};')
+        row = cursor.fetchone()
+        db.commit()
+        return row is not None and row[0] is not None
+
+    @staticmethod
+    def _start(db, importer, header_line):
+        importer.bind(db)
+        importer.start(header_line)
+
+    @staticmethod
+    def _flush(db, importer):
+        importer.bind(db)
+        importer.flush()
+
+    async def _read_line(self, reader, timeout):
+        '''Read one line from a connection.
+
+           Args:
+               reader (asyncio.StreamReader): The connection.
+               timeout (float): How long to wait for the line, in seconds.
+
+           Returns:
+               The line (str), '' on timeout, or None on disconnection.
+        '''
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        except asyncio.TimeoutError:
+            return ''
+        if not line.endswith(b'\n'):
+            # Disconnection (an incomplete line is discarded).
+            return None
+        return line[:-1].decode('ascii')
+
+    async def _handle_connection(self, reader, writer):
+        '''Import the data sent over one connection.
+
+           Args:
+               reader (asyncio.StreamReader): The input side of the connection.
+               writer (asyncio.StreamWriter): The output side of the connection.
+
+           Returns:
+               Nothing.
+        '''
+        peer = writer.get_extra_info('peername')
+        dataset_id = None
+        importer = None
+        try:
+            # Select the dataset.
+            handshake = await self._read_line(reader, HANDSHAKE_TIMEOUT)
+            fields = handshake.split() if handshake else []
+            if len(fields) != 2 or fields[0] != 'dataset' or not fields[1].isdigit():
+                writer.write(b'error: expected "dataset <id>"\n')
+                return
+
+            # The connection is counted before checking that the dataset is
+            # recording, so that the dataset is not stopped in the meantime.
+            await self._not_reaping.wait()
+            dataset_id = int(fields[1])
+            self._connections[dataset_id] = self._connections.get(dataset_id, 0) + 1
+            self._last_activity[dataset_id] = time.monotonic()
+            if not await self._run_db(self._is_recording, dataset_id):
+                writer.write(b'error: dataset is not recording\n')
+                return
+
+            self._log(f'Connection from {peer[0]}:{peer[1]} to dataset {dataset_id}')
+
+            header_line = await self._read_line(reader, INACTIVITY_TIMEOUT / 1000)
+            if not header_line:
+                return
+
+            importer = Importer(dataset_id, None, use_syslog=True)
+            lock = self._dataset_locks.setdefault(dataset_id, asyncio.Lock())
+            async with lock:
+                await self._run_db(self._start, importer, header_line)
+
+            while True:
+                # Insert the pending rows when the batch is full or too old. No
+                # more data is read from this connection in the meantime, which
+                # pushes back on the uploader.
+                if importer.needs_flush():
+                    async with lock:
+                        await self._run_db(self._flush, importer)
+                    self._last_activity[dataset_id] = time.monotonic()
+
+                timeout = importer.flush_timeout()
+                line = await self._read_line(
+                    reader, (timeout if timeout is not None else INACTIVITY_TIMEOUT) / 1000)
+                if line is None:
+                    break
+                elif line == '':
+                    if timeout is None:
+                        self._log(f'Ending dataset {dataset_id} due to inactivity')
+                        break
+                else:
+                    importer.process_line(line)
+
+        except Exception:
+            if importer is not None:
+                self._log(f'After {importer.total_frames} frames:')
+            for line in traceback.format_exc().rstrip().split('\n'):
+                self._log(line)
+
+        finally:
+            # Do not lose the rows received so far.
+            try:
+                if importer is not None:
+                    async with self._dataset_locks.setdefault(dataset_id, asyncio.Lock()):
+                        await self._run_db(self._flush, importer)
+                    importer.close()
+            finally:
+                if dataset_id is not None and dataset_id in self._connections:
+                    self._connections[dataset_id] -= 1
+                    if self._connections[dataset_id] == 0:
+                        del self._connections[dataset_id]
+                    self._last_activity[dataset_id] = time.monotonic()
+                writer.close()
+
+    def _recording_datasets(self, db):
+        '''List the datasets recording on this port (in a worker thread).
+
+           Returns:
+               The set of dataset unique identifiers.
+        '''
+        cursor = db.cursor()
+        cursor.execute(f'SELECT `id` FROM `datasets` WHERE `port` = {self._port};')
+        dataset_ids = set([row[0] for row in cursor.fetchall()])
+        db.commit()
+        return dataset_ids
+
+    def _stop_recording(self, db, dataset_ids):
+        '''Stop recording some datasets (in a worker thread).
+
+           Args:
+               dataset_ids (list (int)): The dataset unique identifiers.
+
+           Returns:
+               Nothing.
+        '''
+        ids = ', '.join([str(dataset_id) for dataset_id in dataset_ids])
+        cursor = db.cursor()
+        cursor.execute('UPDATE `datasets` SET `port` = NULL ' +
+                       f'WHERE `id` IN ({ids}) AND `port` = {self._port};')
+        db.commit()
+
+    async def _reap(self):
+        '''Stop recording the datasets without activity.
+
+           Returns:
+               Nothing.
+        '''
+        recording = await self._run_db(self._recording_datasets)
+
+        self._not_reaping.clear()
+        try:
+            now = time.monotonic()
+            inactive = list()
+            for dataset_id in recording:
+                if dataset_id in self._connections:
+                    continue
+                last_activity = self._last_activity.setdefault(dataset_id, now)
+                if now - last_activity > INACTIVITY_TIMEOUT / 1000:
+                    inactive.append(dataset_id)
+
+            # Forget the datasets that are not recording (anymore).
+            for dataset_id in list(self._last_activity):
+                if dataset_id not in recording and dataset_id not in self._connections:
+                    del self._last_activity[dataset_id]
+
+            if inactive:
+                await self._run_db(self._stop_recording, inactive)
+                for dataset_id in inactive:
+                    del self._last_activity[dataset_id]
+                    self._log(f'Stopped recording dataset {dataset_id}')
+        finally:
+            self._not_reaping.set()
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            try:
+                await self._reap()
+            except Exception:
+                for line in traceback.format_exc().rstrip().split('\n'):
+                    self._log(line)
+
+    async def start(self):
+        '''Start accepting connections.
+
+           Returns:
+               Nothing.
+        '''
+        self._server = await asyncio.start_server(self._handle_connection, '0.0.0.0', self._port,
+                                                  limit=LINE_LIMIT)
+        self._log(f'Listening on port {self._port}')
+        self._reaper_task = asyncio.ensure_future(self._reaper())
+
+    async def stop(self):
+        '''Stop accepting connections.
+
+           Returns:
+               Nothing.
+        '''
+        self._reaper_task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+if __name__ == '__main__':
+    # Never start the daemon from a web request.
+    if 'GATEWAY_INTERFACE' in os.environ:
+        sys.stdout.write('Status: 403 Forbidden\n\n')
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=INGEST_PORT,
+                        help='The TCP port to listen on')
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help='The number of connections to the database')
+    args = parser.parse_args()
+    if args.port is None:
+        parser.error('no port specified (see INGEST_PORT in config.py)')
+
+    syslog.openlog('postal_ingest')
+    syslog.syslog('Started ingest daemon')
+
+    # The event loop is run by hand, as Python 3.6 has neither asyncio.run()
+    # nor Server.serve_forever().
+    loop = asyncio.get_event_loop()
+    server = IngestServer(args.port, args.pool_size)
+    try:
+        loop.run_until_complete(server.start())
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(server.stop())
+    finally:
+        syslog.closelog()
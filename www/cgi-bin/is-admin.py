@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
-import cgitb
-import sys
-
 from auth import is_admin
+from endpoint import run_cgi
+
+def handle(request):
+    request.start([('Content-Type', 'application/octet-stream')])
+    request.write('yes' if is_admin() else 'no')
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.write('yes' if is_admin() else 'no')
-sys.stdout.flush()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+'''
+A daemon relaying the rows committed by the importers to the live streams.
+
+The importers (import.py and ingest.py) publish each batch of rows once it is
+committed, and stream.py subscribes to the batches of a dataset for each client
+following it live, so that following a dataset does not poll MySQL. Both connect
+to the daemon on the local host, and send a first line selecting their role and
+the dataset ("publish <id>" or "subscribe <id>"). The batches are then relayed as
+one line of JSON each: {"columns": [...], "rows": [[t, value, ...], ...]}.
+'''
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import syslog
+import traceback
+
+try:
+    from config import LIVE_PORT
+except ImportError:
+    LIVE_PORT = None
+
+HANDSHAKE_TIMEOUT = 30
+'''The time allowed to send the handshake line after connecting, in seconds.'''
+
+LINE_LIMIT = 64 * 1024 * 1024
+'''The maximum length of a batch of rows, in bytes.'''
+
+SUBSCRIBER_BACKLOG = 16 * 1024 * 1024
+'''The maximum size of the batches waiting to be sent to a subscriber, in bytes.'''
+
+PUBLISH_TIMEOUT = 5
+'''The time allowed to publish a batch, in seconds.'''
+
+class Publisher:
+    def __init__(self, dataset_id, port=LIVE_PORT):
+        '''Constructor.
+
+           Args:
+               dataset_id (int): The dataset unique identifier.
+               port (int): The TCP port of the daemon, or None if there is none.
+        '''
+        self._dataset_id = dataset_id
+        self._port = port
+        self._sock = None
+
+    def publish(self, columns, rows):
+        '''Publish a batch of rows, on a best-effort basis.
+
+           Errors (such as the daemon not running) are ignored, and the
+           connection is retried with the next batch.
+
+           Args:
+               columns (list (str)): The columns of the rows, without the time.
+               rows (list): The rows, the timestamp first then one value per
+                   column (None for NULL).
+
+           Returns:
+               Nothing.
+        '''
+        if self._port is None or not rows:
+            return
+
+        line = json.dumps({'columns': columns, 'rows': rows}) + '\n'
+        try:
+            if self._sock is None:
+                self._sock = socket.create_connection(('127.0.0.1', self._port),
+                                                      timeout=PUBLISH_TIMEOUT)
+                self._sock.sendall(f'publish {self._dataset_id}\n'.encode('ascii'))
+            self._sock.sendall(line.encode('utf-8'))
+        except OSError:
+            self.close()
+
+    def close(self):
+        '''Close the connection to the daemon, if any.
+
+           Returns:
+               Nothing.
+        '''
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+def subscribe(dataset_id, port=LIVE_PORT):
+    '''Subscribe to the batches of rows of a dataset.
+
+       Args:
+           dataset_id (int): The dataset unique identifier.
+           port (int): The TCP port of the daemon.
+
+       Returns:
+           The connection to the daemon (socket), receiving one line of JSON
+           per batch.
+    '''
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f'subscribe {dataset_id}\n'.encode('ascii'))
+    return sock
+
+class LiveServer:
+    def __init__(self, port):
+        '''Constructor.
+
+           Args:
+               port (int): The TCP port to listen on.
+        '''
+        self._port = port
+
+        # The connections of the subscribers, by dataset.
+        self._subscribers = dict()
+
+        # Set by start().
+        self._server = None
+
+    def _log(self, message):
+        syslog.syslog(message)
+
+    def _relay(self, dataset_id, line):
+        '''Send a batch to the subscribers of a dataset.
+
+           The subscribers that do not keep up are disconnected, rather than
+           buffering an unbounded amount of data for them.
+
+           Args:
+               dataset_id (int): The dataset unique identifier.
+               line (bytes): The batch.
+
+           Returns:
+               Nothing.
+        '''
+        for writer in list(self._subscribers.get(dataset_id, ())):
+            if writer.transport.get_write_buffer_size() > SUBSCRIBER_BACKLOG:
+                self._log(f'Dropping a subscriber of dataset {dataset_id}')
+                writer.close()
+            else:
+                writer.write(line)
+
+    async def _handle_connection(self, reader, writer):
+        '''Serve one publisher or subscriber.
+
+           Args:
+               reader (asyncio.StreamReader): The input side of the connection.
+               writer (asyncio.StreamWriter): The output side of the connection.
+
+           Returns:
+               Nothing.
+        '''
+        try:
+            try:
+                handshake = await asyncio.wait_for(reader.readline(), HANDSHAKE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+            fields = handshake.decode('ascii', 'replace').split()
+            if len(fields) != 2 or fields[0] not in ('publish', 'subscribe') or \
+               not fields[1].isdigit():
+                writer.write(b'error: expected "publish <id>" or "subscribe <id>"\n')
+                return
+            role, dataset_id = fields[0], int(fields[1])
+
+            if role == 'subscribe':
+                subscribers = self._subscribers.setdefault(dataset_id, set())
+                subscribers.add(writer)
+                try:
+                    # Nothing is expected from the subscriber, until it
+                    # disconnects (or is disconnected).
+                    while await reader.read(4096):
+                        pass
+                finally:
+                    subscribers.discard(writer)
+                    if not subscribers:
+                        del self._subscribers[dataset_id]
+            else:
+                while True:
+                    line = await reader.readline()
+                    if not line.endswith(b'\n'):
+                        # Disconnection (an incomplete batch is discarded).
+                        break
+                    self._relay(dataset_id, line)
+
+        except Exception:
+            for line in traceback.format_exc().rstrip().split('\n'):
+                self._log(line)
+
+        finally:
+            writer.close()
+
+    async def start(self):
+        '''Start accepting connections.
+
+           Returns:
+               Nothing.
+        '''
+        self._server = await asyncio.start_server(self._handle_connection, '127.0.0.1', self._port,
+                                                  limit=LINE_LIMIT)
+        self._log(f'Listening on port {self._port}')
+
+    async def stop(self):
+        '''Stop accepting connections.
+
+           Returns:
+               Nothing.
+        '''
+        self._server.close()
+        await self._server.wait_closed()
+
+if __name__ == '__main__':
+    # Never start the daemon from a web request.
+    if 'GATEWAY_INTERFACE' in os.environ:
+        sys.stdout.write('Status: 403 Forbidden\n\n')
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=LIVE_PORT,
+                        help='The TCP port to listen on')
+    args = parser.parse_args()
+    if args.port is None:
+        parser.error('no port specified (see LIVE_PORT in config.py)')
+
+    syslog.openlog('postal_live')
+    syslog.syslog('Started live update daemon')
+
+    # The event loop is run by hand, as Python 3.6 has neither asyncio.run()
+    # nor Server.serve_forever().
+    loop = asyncio.get_event_loop()
+    server = LiveServer(args.port)
+    try:
+        loop.run_until_complete(server.start())
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(server.stop())
+    finally:
+        syslog.closelog()
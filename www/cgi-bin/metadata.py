@@ -0,0 +1,71 @@
+import collections
+import json
+import threading
+
+from db import DB
+
+CACHE_SIZE = 256
+'''The number of datasets whose parsed metadata is cached (per process).'''
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+def load_metadata(cursor, dataset):
+    '''Load the metadata of a dataset.
+
+       The parsed metadata is cached in the process, as long as it does not
+       change in the database. It must not be modified by the caller.
+
+       Args:
+           cursor (MySQLCursor): The cursor to the database.
+           dataset (int): The dataset unique identifier.
+
+       Returns:
+           The metadata (dict), empty if there is none.
+    '''
+    cursor.execute(f'SELECT `metadata` FROM `metadata` WHERE `id` = {dataset};')
+    row = cursor.fetchone()
+    if row is None:
+        return dict()
+
+    with _cache_lock:
+        cached = _cache.get(dataset)
+        if cached is not None and cached[0] == row[0]:
+            _cache.move_to_end(dataset)
+            return cached[1]
+
+    metadata = json.loads(row[0])
+    with _cache_lock:
+        _cache[dataset] = (row[0], metadata)
+        _cache.move_to_end(dataset)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return metadata
+
+def load_schema(cursor, dataset):
+    '''Load the columns of a dataset, and their SQL types.
+
+       The schema is recorded in the metadata by the importer. For datasets
+       that predate it, the (slow) catalog of the database is queried instead.
+
+       Args:
+           cursor (MySQLCursor): The cursor to the database.
+           dataset (int): The dataset unique identifier.
+
+       Returns:
+           The map (dict) of columns to SQL types (str, such as
+           'TINYINT UNSIGNED'), in the order of the table, without the time.
+    '''
+    schema = load_metadata(cursor, dataset).get('schema')
+    if schema is not None:
+        return dict(schema)
+
+    query = 'SELECT `column_name`, `data_type`, `column_type` FROM INFORMATION_SCHEMA.COLUMNS ' + \
+            'WHERE `table_schema` = %s AND `table_name` = %s ORDER BY `ordinal_position`;'
+    cursor.execute(query, (DB, f'dataset_{dataset}'))
+    schema = dict()
+    for column, data_type, column_type in cursor.fetchall():
+        if column == 't':
+            continue
+        schema[column] = (data_type + (' unsigned' if column_type.endswith('unsigned') else '')).upper()
+    return schema
@@ -1,91 +1,90 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
-import MySQLdb
 import os
-import sys
+import subprocess
 import time
 
+try:
+    from config import INGEST_PORT
+except ImportError:
+    INGEST_PORT = None
+
 from auth import get_username
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
 
 path = os.path.dirname(os.path.abspath(__file__))
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-args = cgi.FieldStorage()
-project = args['project'].value.lower() if 'project' in args else ''
-description = args['description'].value
+    args = request.args
+    project = args['project'].value.lower() if 'project' in args else ''
+    description = args['description'].value
 
-# TODO: Migrate to POST if possible.
+    # TODO: Migrate to POST if possible.
 
-owner = get_username()
+    owner = get_username()
 
-rpipe = -1
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    db.autocommit(True)
-    cursor = db.cursor()
-
-    # The web UI uses '-' in places.
-    if project == '-':
-        project = ''
-
-    query = 'INSERT INTO `datasets`(`owner`, `created`, `updated`, `description`, `flags`, `project`) ' + \
-            'VALUES(%s, NOW(), NOW(), %s, 0, %s);'
-    cursor.execute(query, (owner, description, project))
-
-    query = 'SELECT LAST_INSERT_ID();'
-    cursor.execute(query)
-    dataset_id = cursor.fetchone()[0]
-
-    rpipe, wpipe = os.pipe()
-    pid = os.fork()
-    if pid == 0:
-        # This is an important line! CGI will hang if we don't close stdin.
-        os.close(sys.stdin.fileno())
-
-        os.close(rpipe)
-        os.dup2(wpipe, sys.stdout.fileno())
-        os.dup2(wpipe, sys.stderr.fileno())
-        os.close(wpipe)
-        os.setsid()
-        os.execvp('python3.6', ['python3.6', os.path.join(path, 'import.py'),
-                                str(dataset_id)])
-        sys.stdout.flush()
-        sys.stderr.flush()
-        sys.exit(1)
-    os.close(wpipe)
-
-    end_time = time.time() + 10
-    while True:
-        if time.time() > end_time:
-            break
-
-        query = f'SELECT `port` FROM `datasets` WHERE `id` = {dataset_id};'
-        cursor.execute(query)
-        port = cursor.fetchone()[0]
+    importer = None
+    db = request.db
+    try:
+        db.autocommit(True)
+        cursor = db.cursor()
 
-        if port is not None:
-            break
-        time.sleep(1)
+        # The web UI uses '-' in places.
+        if project == '-':
+            project = ''
 
-    results = {
-        'datasetId': dataset_id,
-        'port': port,
-    }
+        query = 'INSERT INTO `datasets`(`owner`, `created`, `updated`, `description`, `flags`, `project`) ' + \
+                'VALUES(%s, NOW(), NOW(), %s, 0, %s);'
+        cursor.execute(query, (owner, description, project))
 
-    if port is None:
-        pipef = os.fdopen(rpipe)
-        results['error'] = pipef.read()
-
-    sys.stdout.write(json.dumps(results))
-
-finally:
-    if rpipe != -1:
-        os.close(rpipe)
-    sys.stdout.flush()
-    db.close()
+        query = 'SELECT LAST_INSERT_ID();'
+        cursor.execute(query)
+        dataset_id = cursor.fetchone()[0]
+
+        if INGEST_PORT is not None:
+            # The ingest daemon is already listening, just mark the dataset as
+            # recording.
+            port = INGEST_PORT
+            query = f'UPDATE `datasets` SET `port` = {port} WHERE `id` = {dataset_id};'
+            cursor.execute(query)
+        else:
+            # The importer must not hold on to the input and output of the
+            # request, or the web server would wait for it to exit.
+            importer = subprocess.Popen(['python3.6', os.path.join(path, 'import.py'),
+                                         str(dataset_id)],
+                                        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, start_new_session=True)
+
+            end_time = time.time() + 10
+            while True:
+                if time.time() > end_time:
+                    break
+
+                query = f'SELECT `port` FROM `datasets` WHERE `id` = {dataset_id};'
+                cursor.execute(query)
+                port = cursor.fetchone()[0]
+
+                if port is not None:
+                    break
+                time.sleep(1)
+
+        results = {
+            'datasetId': dataset_id,
+            'port': port,
+        }
+        if INGEST_PORT is not None:
+            results['handshake'] = f'dataset {dataset_id}'
+
+        if port is None and importer is not None:
+            results['error'] = importer.stdout.read().decode()
+
+        request.write(json.dumps(results))
+
+    finally:
+        if importer is not None:
+            importer.stdout.close()
+
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -0,0 +1,95 @@
+import math
+
+RESOLUTIONS = [1, 60, 3600]
+'''The bucket widths of the rollups, from the finest to the coarsest, in seconds.'''
+
+def create_rollup_table(cursor, dataset):
+    '''Create the rollup table of a dataset, if it does not exist.
+
+       The rollup table holds, for each column (k), resolution (res) and bucket
+       (b, the start of the bucket), the first and last timestamps, the minimum
+       and maximum values, the sum of the values and the count of values.
+
+       Args:
+           cursor (MySQLCursor): The cursor to the database.
+           dataset (int): The dataset unique identifier.
+
+       Returns:
+           True if the table was created.
+    '''
+    cursor.execute('SHOW TABLES LIKE %s;', (f'rollup_{dataset}',))
+    if cursor.fetchone() is not None:
+        return False
+
+    create_table = f'CREATE TABLE `rollup_{dataset}`(' + \
+                   '`k` VARCHAR(64) NOT NULL, `res` INT NOT NULL, `b` DOUBLE NOT NULL, ' + \
+                   '`tf` DOUBLE, `tl` DOUBLE, `vmin` DOUBLE, `vmax` DOUBLE, `vsum` DOUBLE, ' + \
+                   '`n` BIGINT, PRIMARY KEY (`k`, `res`, `b`));'
+    cursor.execute(create_table)
+    return True
+
+def update_rollups(cursor, dataset, columns, t_min, t_max):
+    '''Recompute the rollup buckets overlapping an interval.
+
+       The finest rollup is recomputed from the raw data, then each coarser
+       rollup is recomputed from the previous one, so that the cost only
+       depends on the number of buckets touched. Each rollup is recomputed for
+       all the columns at once, reading the raw data only once. Recomputing is
+       idempotent, which makes it safe with duplicate rows.
+
+       Args:
+           cursor (MySQLCursor): The cursor to the database.
+           dataset (int): The dataset unique identifier.
+           columns (list (str)): The columns to recompute.
+           t_min (float): The lowest timestamp in the interval.
+           t_max (float): The highest timestamp in the interval.
+
+       Returns:
+           Nothing.
+    '''
+    columns = list(columns)
+    if not columns:
+        return
+
+    # The raw rows are joined with the names of the columns, giving one row
+    # per timestamp and column with the value of that column.
+    names = ' UNION ALL '.join(['SELECT %s AS `k`'] * len(columns))
+    values = ' '.join([f'WHEN %s THEN `d`.`{column}`' for column in columns])
+    keys = ', '.join(['%s'] * len(columns))
+
+    previous = None
+    for res in RESOLUTIONS:
+        lo = math.floor(t_min / res) * res
+        hi = math.floor(t_max / res) * res + res
+
+        if previous is None:
+            query = f'REPLACE INTO `rollup_{dataset}` ' + \
+                    f'SELECT `k`, {res}, FLOOR(`t` / {res}) * {res} AS `bucket`, ' + \
+                    'MIN(`t`), MAX(`t`), MIN(`v`), MAX(`v`), SUM(`v`), COUNT(*) ' + \
+                    'FROM (SELECT `names`.`k` AS `k`, `d`.`t` AS `t`, ' + \
+                    f'CASE `names`.`k` {values} END AS `v` ' + \
+                    f'FROM `dataset_{dataset}` AS `d` JOIN ({names}) AS `names` ' + \
+                    f'WHERE `d`.`t` >= {lo} AND `d`.`t` < {hi}) AS `raw` ' + \
+                    'WHERE `v` IS NOT NULL GROUP BY `k`, `bucket`;'
+            cursor.execute(query, columns + columns)
+        else:
+            query = f'REPLACE INTO `rollup_{dataset}` ' + \
+                    f'SELECT `k`, {res}, FLOOR(`b` / {res}) * {res} AS `bucket`, ' + \
+                    'MIN(`tf`), MAX(`tl`), MIN(`vmin`), MAX(`vmax`), SUM(`vsum`), SUM(`n`) ' + \
+                    f'FROM `rollup_{dataset}` WHERE `k` IN ({keys}) AND `res` = {previous} ' + \
+                    f'AND `b` >= {lo} AND `b` < {hi} GROUP BY `k`, `bucket`;'
+            cursor.execute(query, columns)
+
+        previous = res
+
+def select_resolution(width):
+    '''Select the coarsest rollup that is at least as fine as a bucket width.
+
+       Args:
+           width (float): The requested bucket width, in seconds.
+
+       Returns:
+           The resolution of the rollup (int), or None to use the raw data.
+    '''
+    candidates = [res for res in RESOLUTIONS if res <= width]
+    return candidates[-1] if candidates else None
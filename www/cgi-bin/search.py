@@ -1,45 +1,77 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
-import MySQLdb
-import sys
+import re
 
 from datetime import timezone
 
-from db import HOST, USER, PASSWORD, DB
+from db import DB
+from endpoint import run_cgi
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+FULLTEXT_MIN_TOKEN = 3
+'''The shortest word indexed by FULLTEXT (innodb_ft_min_token_size).'''
 
-args = cgi.FieldStorage()
-regex = args['regex'].value if 'regex' in args else ''
-start = int(args['start'].value) if 'start' in args else 0
-count = int(args['count'].value) if 'count' in args else 50
+# Whether the datasets table has a FULLTEXT index, looked up once per process.
+_has_fulltext = None
 
 def utc_to_local(utc_dt):
     return utc_dt.replace(tzinfo=timezone.utc).astimezone(tz=None)
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
-    cursor = db.cursor()
+def has_fulltext(cursor):
+    global _has_fulltext
+    if _has_fulltext is None:
+        cursor.execute("SHOW INDEX FROM `datasets` WHERE `Index_type` = 'FULLTEXT';")
+        _has_fulltext = len(cursor.fetchall()) > 0
+    return _has_fulltext
 
-    query = 'SELECT `id`, `owner`, `updated`, `description`, `flags`, `project` FROM `datasets` '
+def handle(request):
+    args = request.args
+    regex = args['regex'].value if 'regex' in args else ''
+    start = int(args['start'].value) if 'start' in args else 0
+    count = int(args['count'].value) if 'count' in args else 50
+    cursor_arg = args['cursor'].value if 'cursor' in args else None
+
+    cursor = request.db.cursor()
+
+    conditions = list()
+    query_args = list()
     if regex != '':
-        # TODO: Possible SQL injection through use of "regex".
-        query += 'WHERE `owner` LIKE \'%{0}%\' OR `description` LIKE \'%{0}%\''.format(regex)
-    query += f'ORDER BY `updated` DESC LIMIT {start}, {count};'
+        # Match whole words (or their prefixes) with the FULLTEXT index when
+        # possible, otherwise any substring (which scans the table).
+        words = re.findall(r'\w+', regex)
+        if words and has_fulltext(cursor) and min(map(len, words)) >= FULLTEXT_MIN_TOKEN:
+            conditions.append('MATCH(`owner`, `description`, `project`) AGAINST (%s IN BOOLEAN MODE)')
+            query_args.append(' '.join([f'+{word}*' for word in words]))
+        else:
+            conditions.append('(`owner` LIKE %s OR `description` LIKE %s OR `project` LIKE %s)')
+            query_args += [f'%{regex}%'] * 3
+    if cursor_arg is not None:
+        # The cursor is the position of the last dataset of the previous page,
+        # in the (updated, id) order.
+        updated, id = cursor_arg.rsplit('/', 1)
+        conditions.append('(`updated` < %s OR (`updated` = %s AND `id` < %s))')
+        query_args += [updated, updated, int(id)]
+        start = 0
 
-    cursor.execute(query)
+    query = 'SELECT `id`, `owner`, `updated`, `description`, `flags`, `project` FROM `datasets` '
+    if conditions:
+        query += 'WHERE ' + ' AND '.join(conditions) + ' '
+    query += f'ORDER BY `updated` DESC, `id` DESC LIMIT {start}, {count};'
+
+    cursor.execute(query, query_args or None)
     rows = cursor.fetchall()
 
+    # Look up the sizes of all the datasets at once.
+    sizes = dict()
+    if rows:
+        query = 'SELECT `table_name`, DATA_LENGTH + INDEX_LENGTH, TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES ' + \
+                'WHERE `table_schema` = %s AND `table_name` IN ({});'.format(', '.join(['%s'] * len(rows)))
+        cursor.execute(query, [DB] + [f'dataset_{row[0]}' for row in rows])
+        for table_name, size, table_rows in cursor.fetchall():
+            sizes[table_name] = (size, table_rows)
+
     results = []
     for row in rows:
-        query = 'SELECT DATA_LENGTH + INDEX_LENGTH AS `size` FROM INFORMATION_SCHEMA.TABLES ' + \
-                'WHERE `table_name` = %s;'
-        cursor.execute(query, (f'dataset_{row[0]}',))
-        other_row = cursor.fetchone()
+        size, table_rows = sizes.get(f'dataset_{row[0]}', (None, None))
 
         entry = {
             'datasetId': row[0],
@@ -48,12 +80,17 @@ try:
             'description': row[3],
             'flags': row[4],
             'project': row[5].lower(),
-            'size': '{:.1f}'.format(other_row[0] / (1024 * 1024)) if other_row else '-',
+            'size': '{:.1f}'.format(size / (1024 * 1024)) if size is not None else '-',
+            'rows': table_rows,
         }
         results.append(entry)
 
-    sys.stdout.write(json.dumps(results))
+    headers = [('Content-Type', 'application/json')]
+    if len(rows) == count:
+        last = rows[-1]
+        headers.append(('X-Postal-Next-Cursor', f'{last[2].strftime("%Y-%m-%d %H:%M:%S")}/{last[0]}'))
+    request.start(headers)
+    request.write(json.dumps(results))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
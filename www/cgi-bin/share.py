@@ -1,20 +1,15 @@
 #!/usr/bin/env python3
-import cgitb
 import json
-import MySQLdb
-import sys
 import uuid
 
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/octet-stream\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/octet-stream')])
 
-args = json.load(sys.stdin)
+    args = json.loads(request.read())
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
+    db = request.db
     db.autocommit(True)
     cursor = db.cursor()
 
@@ -24,10 +19,9 @@ try:
     query = 'INSERT INTO `sharelinks`(`id`, `sharedata`) VALUES(%s, %s);'
     cursor.execute(query, (uid, sharedata))
 
-    sys.stdout.write(json.dumps({
+    request.write(json.dumps({
         'share': uid,
     }))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import json
+import select
+
+from auth import protect_dataset
+from codec import COMPRESSORS, negotiate
+from endpoint import run_cgi
+from fetch import ENABLE_COMPRESSION, FROM_SQL_TYPE, pack_block_delta
+from live import LIVE_PORT, subscribe
+from metadata import load_schema
+
+KEEPALIVE = 15
+'''The time between two empty blocks sent to an idle client, in seconds.'''
+
+RECV_SIZE = 256 * 1024
+'''The size of the reads from the live update daemon, in bytes.'''
+
+def select_rows(batch, keys):
+    '''Select the values of some keys in a batch of rows published by an importer.
+
+       Args:
+           batch (dict): The batch, see live.py.
+           keys (list (str)): The keys.
+
+       Returns:
+           The rows (list), the timestamp first then one value per key, without
+           the rows where all the values are NULL.
+    '''
+    indexes = {column: index for index, column in enumerate(batch['columns'], start=1)}
+    selected = [indexes.get(key) for key in keys]
+
+    rows = list()
+    for row in batch['rows']:
+        values = [row[index] if index is not None else None for index in selected]
+        if any([value is not None for value in values]):
+            rows.append([row[0]] + values)
+    return rows
+
+def handle(request):
+    args = request.args
+    dataset = int(args['d'].value)
+    keys = args.getlist('key')
+
+    cursor = request.db.cursor()
+    protect_dataset(cursor, dataset)
+
+    # Look up the types of the requested columns (all of them by default).
+    # This also rejects any key that is not an existing column.
+    schema = load_schema(cursor, dataset)
+    keys = keys or list(schema)
+    columns = [(key, *FROM_SQL_TYPE[schema[key]]) for key in keys]
+
+    # The stream can last for hours, the connection to the database is not
+    # kept for so long.
+    request.close()
+
+    if LIVE_PORT is None:
+        request.start([('Content-Type', 'text/plain')], status='404 Not Found')
+        request.write('Live streams are not enabled\n')
+        return
+
+    # The compressed data is sent after each batch, which LZMA cannot do.
+    codec = negotiate(request.environ.get('HTTP_X_POSTAL_CODECS'), ENABLE_COMPRESSION)
+    if codec == 'lzma':
+        codec = 'none'
+
+    try:
+        sock = subscribe(dataset)
+    except OSError:
+        # The live update daemon is not running: the client polls instead.
+        request.start([('Content-Type', 'text/plain')], status='503 Service Unavailable')
+        request.write('The live update daemon is not running\n')
+        return
+
+    try:
+        request.start([
+            ('Content-Type', 'application/octet-stream'),
+            ('X-Postal-Codec', codec),
+        ])
+
+        # The same encoding as fetch.py for several keys (version 2), with
+        # one block per batch of rows committed by the importers.
+        compressor = COMPRESSORS[codec]()
+        header = {
+            'columns': [{'key': key, 'type': type} for key, type, _ in columns],
+            'encoding': 2,
+        }
+        request.write(compressor.compress((json.dumps(header) + '\n').encode('utf-8')) +
+                      compressor.sync())
+
+        buffer = b''
+        while True:
+            ready, _, _ = select.select([sock], [], [], KEEPALIVE)
+            if not ready:
+                # An empty block keeps the connection alive, and detects the
+                # clients that are gone.
+                request.write(compressor.compress(pack_block_delta([], columns)) +
+                              compressor.sync())
+                continue
+
+            data = sock.recv(RECV_SIZE)
+            if not data:
+                # The daemon stopped.
+                break
+
+            # Split into batches, keeping any incomplete batch for later.
+            lines = (buffer + data).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                rows = select_rows(json.loads(line), keys)
+                if rows:
+                    request.write(compressor.compress(pack_block_delta(rows, columns)) +
+                                  compressor.sync())
+
+        request.write(compressor.flush())
+    finally:
+        sock.close()
+
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -1,24 +1,21 @@
 #!/usr/bin/env python3
-import cgi
-import cgitb
 import json
 import MySQLdb
-import sys
 
 from auth import protect_dataset
-from db import HOST, USER, PASSWORD, DB
+from endpoint import run_cgi
+from metadata import load_schema
+from rollup import update_rollups
 
-cgitb.enable()
-sys.stdout.write('Content-Type: application/json\n\n')
-sys.stdout.flush()
+def handle(request):
+    request.start([('Content-Type', 'application/json')])
 
-args = cgi.FieldStorage()
-dataset = int(args['d'].value)
-left = float(args['left'].value) if 'left' in args else None
-right = float(args['right'].value) if 'right' in args else None
+    args = request.args
+    dataset = int(args['d'].value)
+    left = float(args['left'].value) if 'left' in args else None
+    right = float(args['right'].value) if 'right' in args else None
 
-db = MySQLdb.connect(HOST, USER, PASSWORD, DB)
-try:
+    db = request.db
     db.autocommit(True)
     cursor = db.cursor()
 
@@ -37,9 +34,23 @@ try:
         replace_logger = True
 
     if replace_logger:
+        # Drop the rollup buckets that are now empty, and recompute the ones
+        # straddling the new bounds.
+        cursor.execute('SHOW TABLES LIKE %s;', (f'rollup_{dataset}',))
+        if cursor.fetchone() is not None:
+            columns = list(load_schema(cursor, dataset))
+
+            if left is not None:
+                cursor.execute(f'DELETE FROM `rollup_{dataset}` WHERE `tl` < {left}')
+                update_rollups(cursor, dataset, columns, left, left)
+            if right is not None:
+                cursor.execute(f'DELETE FROM `rollup_{dataset}` WHERE `tf` > {right}')
+                update_rollups(cursor, dataset, columns, right, right)
+
         # Force getting a new logger. Trimming the dataset can create an
-        # inconsistent state in import.py.
-        cursor.execute(f'UPDATE `datasets` SET `port` = NULL WHERE `id` = {dataset};')
+        # inconsistent state in import.py. Bumping the "Last Updated" time
+        # invalidates the data cached by clients.
+        cursor.execute(f'UPDATE `datasets` SET `port` = NULL, `updated` = NOW() WHERE `id` = {dataset};')
 
     try:
         cursor.execute(f'SELECT MIN(`t`), MAX(`t`) FROM `dataset_{dataset}`;')
@@ -52,8 +63,7 @@ try:
         'right': row[1],
     }
 
-    sys.stdout.write(json.dumps(results))
+    request.write(json.dumps(results))
 
-finally:
-    sys.stdout.flush()
-    db.close()
+if __name__ == '__main__':
+    run_cgi(handle)
@@ -0,0 +1,36 @@
+import re
+
+from metadata import load_metadata
+
+def load_valid_map(cursor, dataset):
+    '''Load the map of validity keys of a dataset from its metadata.
+
+       Args:
+           cursor (MySQLCursor): The cursor to the database.
+           dataset (int): The dataset unique identifier.
+
+       Returns:
+           The map (dict) of key patterns to validity keys.
+    '''
+    return load_metadata(cursor, dataset).get('valid_map', dict())
+
+def get_validity_key(valid_map, key):
+    '''Get the validity key corresponding to a key.
+
+       The patterns of the map are regular expressions, and the validity keys
+       may refer to their groups (as in the Python API).
+
+       Args:
+           valid_map (dict): The map of key patterns to validity keys.
+           key (str): The key to query the corresponding validity key for.
+
+       Returns:
+           The validity key (str) or None.
+    '''
+    for that_key, validity_key in valid_map.items():
+        if re.fullmatch(that_key, key):
+            subbed = re.sub(that_key, validity_key, key)
+            if subbed == key:
+                subbed = validity_key
+            return subbed
+    return None
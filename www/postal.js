@@ -475,11 +475,60 @@ function showAnnotations(show)
 const plotLiveInterval = 10000;
 function updatePlotLive()
 {
-    // TODO: Fetch and merge new data.
+    /*
+     * Fetch the points appended since the last one of each plotted series,
+     * and merge them into the plot once all of them are received.
+     */
+    const labels = g_state.options.labels.slice(3);
+    var pending = 1;
 
-    if (g_state.timerId != null) {
-        g_state.timerId = setTimeout(updatePlotLive, plotLiveInterval);
+    function done()
+    {
+        if (--pending > 0) {
+            return;
+        }
+
+        if (labels.length > 0) {
+            redrawWithOptions({
+                file: g_state.filter ? g_state.filteredData : g_state.data,
+            });
+        }
+
+        if (g_state.timerId != null) {
+            g_state.timerId = setTimeout(updatePlotLive, plotLiveInterval);
+        }
     }
+
+    function update(label, data, filtered)
+    {
+        var index = getIndex(label);
+        if (index == -1) {
+            return;
+        }
+
+        pending++;
+        fetchNewData(label, lastTime(data, index), filtered, function(series) {
+            /*
+             * The series may have been removed from the plot meanwhile.
+             */
+            var index = getIndex(label);
+            if (index != -1) {
+                appendData(data, index, series);
+                if (!filtered && !(label in g_dataset.valid_map)) {
+                    appendData(g_state.filteredData, index, series);
+                }
+            }
+            done();
+        });
+    }
+
+    for (const label of labels) {
+        update(label, g_state.data, false);
+        if (label in g_dataset.valid_map) {
+            update(label, g_state.filteredData, true);
+        }
+    }
+    done();
 }
 
 /*
@@ -1116,40 +1165,63 @@ function mergeData(data, series)
 }
 
 /*
- * Filter a series.
+ * Find the time of the last point of a series, or null if it has none.
  */
-function filterData(series, valid)
+function lastTime(data, index)
 {
-    var result = [];
-
-    var valid_index = 0
-    var t_valid = valid[valid_index][0];
-    var v_valid = valid[valid_index][1];
-    for (var index = 0; index < series.length; index++) {
-        var t = series[index][0];
-        var v = series[index][1];
-
-        while (valid_index + 1 < valid.length && t_valid < t) {
-            valid_index++;
-            t_valid = valid[valid_index][0];
-            v_valid = valid[valid_index][1];
+    for (var i = data.length - 1; i >= 0; i--) {
+        if (data[i][index] != null) {
+            return data[i][0];
         }
+    }
+    return null;
+}
 
-        /*
-         * The "valid" series is shorter, stop here.
-         */
-        if (t_valid < t) {
-            break;
+/*
+ * Merge new points into a series already plotted (at the given index), all of
+ * them after its last point.
+ */
+function appendData(data, index, series)
+{
+    if (series.length == 0) {
+        return;
+    }
+
+    var blank = [];
+    for (var i = 0; i < data[0].length; i++) {
+        blank.push(null);
+    }
+
+    /*
+     * Start from the first row at (or after) the first new point, searching
+     * from the end since the new points are usually the most recent ones.
+     */
+    var data_index = data.length;
+    while (data_index > 0 && data[data_index - 1][0] - series[0][0] > -0.001) {
+        data_index--;
+    }
+
+    for (var offset = 0; offset < series.length; offset++) {
+        var t = series[offset][0];
+        var val = series[offset][1];
+
+        while (data_index < data.length && t - data[data_index][0] > 0.001) {
+            data_index++;
         }
 
-        console.assert(t == t_valid, "t != t_valid");
-        // TODO: Filtering should be customizable to a set of values, not just 0.
-        if (v_valid == 0) {
-            result.push([t, v]);
+        if (data_index < data.length && t - data[data_index][0] > -0.001) {
+            /*
+             * Existing row (another series has a value at the same time).
+             */
+            data[data_index][index] = val;
+        } else {
+            var new_row = blank.slice(0);
+            new_row[0] = t;
+            new_row[index] = val;
+            data.splice(data_index, 0, new_row);
         }
+        data_index++;
     }
-
-    return result;
 }
 
 /*
@@ -1209,15 +1281,18 @@ function decodeData(dataview, offset, type)
 }
 
 /*
- * Fetch a series from the database.
+ * Fetch a series from the database. When filtered, only the valid values are
+ * returned by the server, and the series is cached separately.
  */
 var xhr_time;
-function fetchData(label, callback, param)
+function fetchData(label, callback, param, filtered)
 {
+    var cacheKey = filtered ? filteredCacheKey(label) : label;
+
     /*
      * Check the cache first.
      */
-    if (label in g_state.cache) {
+    if (cacheKey in g_state.cache) {
         if (callback != null) {
             callback(param);
         }
@@ -1237,33 +1312,18 @@ function fetchData(label, callback, param)
      */
     xhr_time = new Date();
     var request = new XMLHttpRequest();
-    request.open("GET", "cgi-bin/fetch.py?d=" + g_dataset.datasetId + "&key=" + label, true);
+    request.open("GET", "cgi-bin/fetch.py?d=" + g_dataset.datasetId + "&key=" + label +
+                 (filtered ? "&filter=1" : ""), true);
     request.responseType = 'arraybuffer';
 
     request.onload = function(e) {
         if (this.status == 200) {
             var t2 = new Date();
-            if (has_compression()) {
-                var inStream = new LZMA.iStream(this.response);
-                var outStream = LZMA.decompressFile(inStream);
-                var decompressed = outStream.toUint8Array();
-                var dataview = new DataView(decompressed.buffer);
-            } else {
-                var dataview = new DataView(this.response);
-            }
+            var dataview = decompressResponse(this.response);
             var t3 = new Date();
-            var offset;
-            var type = "";
-            for (offset = 0; offset < dataview.byteLength; offset++) {
-                var c = String.fromCharCode(dataview.getUint8(offset, true));
-                if (c == '\n') {
-                    break;
-                }
-                type += c;
-            }
 
-            g_state.cacheEntries.unshift(label);
-            g_state.cache[label] = decodeData(dataview, offset + 1, type);
+            g_state.cacheEntries.unshift(cacheKey);
+            g_state.cache[cacheKey] = decodeResponse(dataview);
             var t4 = new Date();
 
             if (has_profiling()) {
@@ -1271,7 +1331,7 @@ function fetchData(label, callback, param)
                 console.log("postal --- size: " + this.response.byteLength);
                 console.log("postal - lzma: " + (t3 - t2) + "ms");
                 console.log("postal - decode: " + (t4 - t3) + "ms");
-                console.log("postal --- total points: " + g_state.cache[label].length);
+                console.log("postal --- total points: " + g_state.cache[cacheKey].length);
                 console.log("postal --- total size: " + dataview.byteLength);
                 console.log("postal - cache size: " + g_state.cacheEntries.length);
                 console.log("postal --- cache entries: " + g_state.cacheEntries);
@@ -1286,12 +1346,73 @@ function fetchData(label, callback, param)
     request.send();
 }
 
+/*
+ * Fetch the points of a series after a given time (the whole series if null),
+ * bypassing the cache.
+ */
+function fetchNewData(label, since, filtered, callback)
+{
+    var request = new XMLHttpRequest();
+    request.open("GET", "cgi-bin/fetch.py?d=" + g_dataset.datasetId + "&key=" + label +
+                 (filtered ? "&filter=1" : "") + (since != null ? "&since=" + since : ""),
+                 true);
+    request.responseType = 'arraybuffer';
+
+    request.onload = function(e) {
+        if (this.status == 200) {
+            callback(decodeResponse(decompressResponse(this.response)));
+        } else {
+            callback([]);
+        }
+    };
+    request.onerror = function(e) {
+        callback([]);
+    };
+
+    request.send();
+}
+
+/*
+ * Decompress the response to fetch.py.
+ */
+function decompressResponse(response)
+{
+    if (has_compression()) {
+        var inStream = new LZMA.iStream(response);
+        var outStream = LZMA.decompressFile(inStream);
+        var decompressed = outStream.toUint8Array();
+        return new DataView(decompressed.buffer);
+    }
+    return new DataView(response);
+}
+
+/*
+ * Decode the (decompressed) response to fetch.py: the type of the series,
+ * followed by its points.
+ */
+function decodeResponse(dataview)
+{
+    var offset;
+    var type = "";
+    for (offset = 0; offset < dataview.byteLength; offset++) {
+        var c = String.fromCharCode(dataview.getUint8(offset, true));
+        if (c == '\n') {
+            break;
+        }
+        type += c;
+    }
+
+    return decodeData(dataview, offset + 1, type);
+}
+
+function filteredCacheKey(label)
+{
+    return label + "\0filtered";
+}
+
 function plotData(label, callback, param)
 {
     const hasValid = label in g_dataset.valid_map;
-    if (hasValid) {
-        var valid = g_dataset.valid_map[label];
-    }
 
     function mergeAndPlot()
     {
@@ -1300,8 +1421,7 @@ function plotData(label, callback, param)
 
         var t2 = new Date();
         if (hasValid) {
-            var filteredSeries = filterData(g_state.cache[label],
-                                            g_state.cache[valid]);
+            var filteredSeries = g_state.cache[filteredCacheKey(label)];
         } else {
             var filteredSeries = g_state.cache[label];
         }
@@ -1340,7 +1460,7 @@ function plotData(label, callback, param)
 
     fetchData(label, function() {
         if (hasValid) {
-            fetchData(valid, mergeAndPlot, null);
+            fetchData(label, mergeAndPlot, null, true);
         } else {
             mergeAndPlot();
         }
@@ -1428,38 +1548,19 @@ function buildDataset(datasetId, rawDataset)
     result.datasetId = datasetId;
 
     /*
-     * Fetch column names (keys).
+     * The column names (keys) and annotations come from loadMetadata().
      */
-    var request = new XMLHttpRequest();
-    request.open("GET", "cgi-bin/fetch-columns.py?d=" + datasetId, false);
-    request.send();
-
-    if (request.status == 200) {
-        result.labels = JSON.parse(request.responseText).sort();
-    }
+    result.labels = g_datasetInfo.columns.slice().sort();
     result.enums = rawDataset.enums;
     result.valid_map = {};
     if ('valid_map' in rawDataset) {
         result.valid_map = rawDataset.valid_map;
     }
 
-    /*
-     * Fetch annotations.
-     */
-    var request = new XMLHttpRequest();
-    request.open("GET", "cgi-bin/fetch-annotations.py?d=" + datasetId, false);
-    request.send();
-
     result.annotations = {};
-    if (request.status == 200) {
-        try {
-            dict = JSON.parse(request.responseText);
-        } catch(e) {
-            dict = {};
-        }
-        for (var xval in dict) {
-            result.annotations[parseFloat(xval)] = [dict[xval].id, dict[xval].text, true];
-        }
+    dict = g_datasetInfo.annotations;
+    for (var xval in dict) {
+        result.annotations[parseFloat(xval)] = [dict[xval].id, dict[xval].text, true];
     }
 
     return result;
@@ -1703,6 +1804,7 @@ function onReady()
 }
 
 var g_dataset;
+var g_datasetInfo;
 var g_state;
 var g_plot;
 function main_common()
@@ -1966,11 +2068,19 @@ function loadState(shareId)
 
 function loadMetadata(datasetId)
 {
+    /*
+     * Fetch the metadata, columns and annotations in a single request.
+     */
     var request = new XMLHttpRequest();
-    request.open("GET", "cgi-bin/fetch-metadata.py?d=" + datasetId, false);
+    request.open("GET", "cgi-bin/fetch-info.py?annotations=1&d=" + datasetId, false);
     request.send();
 
     if (request.status == 200) {
-        g_rawDataset = JSON.parse(request.responseText);
+        g_datasetInfo = JSON.parse(request.responseText);
+        if ("restricted" in g_datasetInfo && g_datasetInfo['restricted']) {
+            g_rawDataset = {'restricted': 1};
+        } else {
+            g_rawDataset = g_datasetInfo.metadata;
+        }
     }
 }